@@ -6,8 +6,10 @@ from typing import List
 
 from core.database import get_db
 from models.models import User, ParkingLot, Booking, Payment, UserRole, BookingStatus
-from schemas.schemas import UserResponse, ParkingLotResponse
+from schemas.schemas import UserResponse, ParkingLotResponse, WebSocketMetrics
 from api.routes.auth import get_current_user
+from services.occupancy_retention import occupancy_retention
+from core.websocket_manager import manager
 
 router = APIRouter()
 
@@ -138,3 +140,18 @@ async def update_user_role(
     db.refresh(user)
     
     return {"message": f"User role updated to {role}", "user_id": user_id}
+
+
+@router.get("/storage/occupancy")
+async def get_occupancy_storage_report(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_admin)
+):
+    """Storage and query time saved by occupancy retention (admin only)"""
+    return occupancy_retention.storage_report(db)
+
+
+@router.get("/websockets/metrics", response_model=WebSocketMetrics)
+async def get_websocket_metrics(current_user: User = Depends(require_admin)):
+    """WebSocket connections, send queue depth and sent/coalesced/dropped/evicted counts (admin only)"""
+    return WebSocketMetrics(**manager.stats())
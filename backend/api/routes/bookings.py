@@ -14,6 +14,7 @@ from core.config import settings
 from models.models import Booking, ParkingLot, ParkingSlot, User, SlotStatus, BookingStatus
 from schemas.schemas import BookingCreate, BookingResponse, QRCodeResponse
 from api.routes.auth import get_current_user
+from core.websocket_manager import manager
 
 router = APIRouter()
 
@@ -201,6 +202,16 @@ async def create_booking(
     db.commit()
     db.refresh(new_booking)
     
+    await manager.send_booking_notification(str(current_user.id), {
+        "event": "created",
+        "booking_id": new_booking.id,
+        "lot_id": new_booking.lot_id,
+        "slot_id": new_booking.slot_id,
+        "start_time": new_booking.start_time.isoformat(),
+        "end_time": new_booking.end_time.isoformat(),
+        "status": new_booking.status.value
+    })
+    
     return new_booking
 
 
@@ -431,6 +442,14 @@ async def cancel_booking(
     
     db.commit()
     
+    await manager.send_booking_notification(str(current_user.id), {
+        "event": "cancelled",
+        "booking_id": booking.id,
+        "lot_id": booking.lot_id,
+        "slot_id": booking.slot_id,
+        "refund_amount": round(refund_amount, 2)
+    })
+    
     return {
         "message": "Booking cancelled successfully",
         "cancellation_fee": round(cancellation_fee, 2),
@@ -17,6 +17,7 @@ from schemas.schemas import (
     LotSearchRequest
 )
 from api.routes.auth import get_current_user
+from services.slot_grid import VEHICLE_TYPES, release_expired_bookings, slot_payload
 
 router = APIRouter()
 
@@ -224,9 +225,8 @@ async def get_lot_slots(
     db: Session = Depends(get_db)
 ):
     """Get slots for a parking lot, optionally filtered by vehicle type"""
-    from models.models import ParkingSlot, Booking, SlotStatus, BookingStatus
-    from sqlalchemy import and_, or_
-    from datetime import datetime, timezone, timedelta
+    from models.models import ParkingSlot
+    from sqlalchemy import and_
     
     lot = db.query(ParkingLot).filter(ParkingLot.id == lot_id).first()
     if not lot:
@@ -235,29 +235,7 @@ async def get_lot_slots(
             detail="Parking lot not found"
         )
     
-    # Release expired bookings (end_time + 5 minutes has passed)
-    now_utc = datetime.now(timezone.utc)
-    expired_cutoff = now_utc - timedelta(minutes=5)
-    
-    expired_bookings = db.query(Booking).filter(
-        and_(
-            Booking.lot_id == lot_id,
-            Booking.end_time <= expired_cutoff,
-            Booking.status.in_([BookingStatus.CONFIRMED, BookingStatus.ACTIVE])
-        )
-    ).all()
-    
-    for booking in expired_bookings:
-        # Mark booking as completed
-        booking.status = BookingStatus.COMPLETED
-        # Release the slot
-        if booking.slot_id:
-            slot = db.query(ParkingSlot).filter(ParkingSlot.id == booking.slot_id).first()
-            if slot:
-                slot.status = SlotStatus.AVAILABLE
-    
-    if expired_bookings:
-        db.commit()
+    release_expired_bookings(db, lot_id)
     
     # Build query
     query = db.query(ParkingSlot).filter(
@@ -269,7 +247,7 @@ async def get_lot_slots(
     
     # Filter by vehicle type if provided
     if vehicle_type:
-        if vehicle_type not in ["2wheeler", "4wheeler", "others"]:
+        if vehicle_type not in VEHICLE_TYPES:
             raise HTTPException(status_code=400, detail="Invalid vehicle type")
         query = query.filter(ParkingSlot.vehicle_type == vehicle_type)
     
@@ -277,14 +255,6 @@ async def get_lot_slots(
     
     # Return slot data
     return [
-        {
-            "id": slot.id,
-            "slot_number": slot.slot_number,
-            "vehicle_type": slot.vehicle_type,
-            "status": (slot.status.value if hasattr(slot.status, 'value') else slot.status).upper(),
-            "floor": slot.floor,
-            "zone": slot.zone,
-            "is_active": slot.is_active
-        }
+        slot_payload(slot)
         for slot in slots
     ]
@@ -1,43 +1,182 @@
 """Occupancy Routes"""
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, desc
-from datetime import datetime, timedelta
+from sqlalchemy import and_, func, text
+from datetime import datetime, timedelta, timezone
+import numpy as np
 from typing import List, Optional
 
 from core.database import get_db
-from models.models import OccupancyLog, ParkingLot, ParkingSlot, SlotStatus
-from schemas.schemas import OccupancyData, OccupancyCreate
+from models.models import OccupancyLog, ParkingLot, ParkingSlot, SlotStatus, User
+from core.config import settings
+from core.timescale import choose_rollup
+from schemas.schemas import (
+    OccupancyData, OccupancyCreate, OccupancyBatchCreate, OccupancyBatchResult, OccupancyItemStatus,
+    OccupancyIngestMetrics, OccupancySeries, OccupancyFrameResult
+)
+from services.occupancy_ingest import lot_id_cache, occupancy_writer
+from services.latest_occupancy import latest_occupancy_cache
+from services.recent_occupancy import recent_occupancy
+from services.occupancy_push import occupancy_publisher
+from services.occupancy_dedup import DedupKey, occupancy_deduplicator
+from services.occupancy_frame import FrameError, decode_frame, frame_rows
+from services.occupancy_export import ENCODERS, MEDIA_TYPES, ExportFormat, arrow_available, iter_occupancy_chunks
+from api.routes.admin import require_admin
 
 router = APIRouter()
 
 
-@router.post("/", status_code=status.HTTP_201_CREATED)
-async def log_occupancy(
-    occupancy_data: OccupancyCreate,
-    db: Session = Depends(get_db)
-):
-    """Log occupancy data (called by edge gateway)"""
+def _occupancy_row(reading: OccupancyCreate, now: datetime) -> dict:
+    return {
+        "lot_id": reading.lot_id,
+        "timestamp": reading.timestamp or now,
+        "occupied_count": reading.occupied_count,
+        "total_capacity": reading.total_capacity,
+        "sensor_data": reading.sensor_data or {}
+    }
+
+
+def _buffer_full() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Occupancy buffer is full, retry later",
+        headers={"Retry-After": str(max(1, round(settings.OCCUPANCY_FLUSH_SECONDS)))}
+    )
+
+
+def _dedup_key(reading: OccupancyCreate) -> Optional[DedupKey]:
+    if reading.gateway_id is None or reading.sequence is None:
+        return None
+    return (reading.gateway_id, reading.sequence)
+
+
+async def _queue_rows(rows: List[dict], claimed_keys: List[DedupKey]):
+    """Queue rows all-or-nothing and fan them out to the in-memory views"""
+    if rows and not occupancy_writer.offer_all(rows):
+        # Let the gateway's retry through once the buffer drains
+        if claimed_keys:
+            await occupancy_deduplicator.release(claimed_keys)
+        raise _buffer_full()
+    await latest_occupancy_cache.record(rows)
+    recent_occupancy.record(rows)
+    occupancy_publisher.record_readings(rows)
+
+
+@router.post("/", status_code=status.HTTP_202_ACCEPTED)
+async def log_occupancy(occupancy_data: OccupancyCreate):
+    """Log occupancy data (called by edge gateway); written to the database in the background"""
     
     # Validate lot exists
-    lot = db.query(ParkingLot).filter(ParkingLot.id == occupancy_data.lot_id).first()
-    if not lot:
+    if occupancy_data.lot_id not in await lot_id_cache.valid_ids([occupancy_data.lot_id]):
         raise HTTPException(status_code=404, detail="Parking lot not found")
     
-    # Create occupancy log
-    log = OccupancyLog(
-        lot_id=occupancy_data.lot_id,
-        timestamp=occupancy_data.timestamp or datetime.utcnow(),
-        occupied_count=occupancy_data.occupied_count,
-        total_capacity=occupancy_data.total_capacity,
-        sensor_data=occupancy_data.sensor_data or {}
+    # Drop retries of a reading already accepted
+    key = _dedup_key(occupancy_data)
+    claimed = [key] if key else []
+    if claimed and not (await occupancy_deduplicator.claim(claimed))[0]:
+        return {"message": "Duplicate reading ignored"}
+    
+    await _queue_rows([_occupancy_row(occupancy_data, datetime.utcnow())], claimed)
+    
+    return {"message": "Occupancy queued"}
+
+
+@router.post("/batch", response_model=OccupancyBatchResult, status_code=status.HTTP_202_ACCEPTED)
+async def log_occupancy_batch(batch: OccupancyBatchCreate):
+    """Log many occupancy readings, possibly across lots (called by edge gateways); written in the background"""
+    
+    if len(batch.readings) > settings.OCCUPANCY_BATCH_MAX_READINGS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch exceeds {settings.OCCUPANCY_BATCH_MAX_READINGS} readings"
+        )
+    
+    # Validate lot IDs against the cached set instead of one lookup per reading
+    valid_lots = await lot_id_cache.valid_ids([reading.lot_id for reading in batch.readings])
+    
+    # Claim the dedup keys of valid readings in one call
+    keyed = [
+        (index, _dedup_key(reading)) for index, reading in enumerate(batch.readings)
+        if reading.lot_id in valid_lots and _dedup_key(reading)
+    ]
+    fresh = await occupancy_deduplicator.claim([key for _, key in keyed])
+    duplicates = {index for (index, _), is_fresh in zip(keyed, fresh) if not is_fresh}
+    claimed = [key for (_, key), is_fresh in zip(keyed, fresh) if is_fresh]
+    
+    now = datetime.utcnow()
+    rows = []
+    results = []
+    for index, reading in enumerate(batch.readings):
+        if reading.lot_id not in valid_lots:
+            results.append(OccupancyItemStatus(index=index, status="rejected", error="Parking lot not found"))
+        elif index in duplicates:
+            results.append(OccupancyItemStatus(index=index, status="duplicate"))
+        else:
+            rows.append(_occupancy_row(reading, now))
+            results.append(OccupancyItemStatus(index=index, status="queued"))
+    
+    # The batch is queued as a whole so the gateway can simply resend it on 429
+    await _queue_rows(rows, claimed)
+    
+    return OccupancyBatchResult(
+        accepted=len(rows),
+        rejected=len(results) - len(rows) - len(duplicates),
+        duplicates=len(duplicates),
+        results=results
     )
+
+
+@router.post("/frame", response_model=OccupancyFrameResult, status_code=status.HTTP_202_ACCEPTED)
+async def log_occupancy_frame(request: Request):
+    """Log readings sent as one binary occupancy frame (see services.occupancy_frame for the layout)"""
+    
+    body = await request.body()
+    try:
+        frame = decode_frame(body)
+    except FrameError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    records = frame.records
+    if len(records) > settings.OCCUPANCY_BATCH_MAX_READINGS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Frame exceeds {settings.OCCUPANCY_BATCH_MAX_READINGS} readings"
+        )
+    
+    # Validate every distinct lot once, then mask the records
+    lot_ids = records["lot_id"]
+    unique_lots = np.unique(lot_ids).tolist()
+    valid_lots = await lot_id_cache.valid_ids(unique_lots)
+    valid = np.isin(lot_ids, list(valid_lots))
+    rejected_indices = np.flatnonzero(~valid)
     
-    db.add(log)
-    db.commit()
-    db.refresh(log)
+    # Version 2 frames carry consecutive sequence numbers from one gateway
+    claimed = []
+    duplicates = 0
+    if frame.gateway_id is not None:
+        indices = np.flatnonzero(valid)
+        keys = [(str(frame.gateway_id), frame.base_sequence + int(i)) for i in indices]
+        fresh = np.array(await occupancy_deduplicator.claim(keys), dtype=bool)
+        claimed = [key for key, is_fresh in zip(keys, fresh) if is_fresh]
+        duplicates = int((~fresh).sum()) if len(fresh) else 0
+        valid[indices[~fresh]] = False
     
-    return {"message": "Occupancy logged", "id": log.id}
+    rows = frame_rows(records[valid], frame.timestamps[valid])
+    await _queue_rows(rows, claimed)
+    
+    return OccupancyFrameResult(
+        accepted=len(rows),
+        rejected=len(rejected_indices),
+        duplicates=duplicates,
+        rejected_indices=rejected_indices.tolist()
+    )
+
+
+@router.get("/ingest/metrics", response_model=OccupancyIngestMetrics)
+async def get_ingest_metrics():
+    """Queue depth, flush latency, and readings dropped or rejected (429) by the occupancy write buffer"""
+    return OccupancyIngestMetrics(**occupancy_writer.stats(), duplicates=occupancy_deduplicator.duplicates)
 
 
 @router.get("/lot/{lot_id}/latest", response_model=OccupancyData)
@@ -45,41 +184,31 @@ async def get_latest_occupancy(
     lot_id: int,
     db: Session = Depends(get_db)
 ):
-    """Get latest occupancy for a parking lot"""
+    """Get latest occupancy for a parking lot (served from the latest-reading cache)"""
     
     # Check lot exists
-    lot = db.query(ParkingLot).filter(ParkingLot.id == lot_id).first()
-    if not lot:
+    if lot_id not in await lot_id_cache.valid_ids([lot_id]):
         raise HTTPException(status_code=404, detail="Parking lot not found")
     
-    # Get latest log from database
-    latest_log = db.query(OccupancyLog).filter(
-        OccupancyLog.lot_id == lot_id
-    ).order_by(desc(OccupancyLog.timestamp)).first()
-    
-    if latest_log:
+    latest = await latest_occupancy_cache.get(lot_id)
+    if latest:
         return OccupancyData(
-            lot_id=latest_log.lot_id,
-            timestamp=latest_log.timestamp,
-            occupied_count=latest_log.occupied_count,
-            total_capacity=latest_log.total_capacity,
-            occupancy_rate=latest_log.occupied_count / latest_log.total_capacity if latest_log.total_capacity > 0 else 0,
-            sensor_data=latest_log.sensor_data
+            lot_id=lot_id,
+            timestamp=latest["timestamp"],
+            occupied_count=latest["occupied_count"],
+            total_capacity=latest["total_capacity"],
+            occupancy_rate=latest["occupied_count"] / latest["total_capacity"] if latest["total_capacity"] > 0 else 0,
+            sensor_data=latest["sensor_data"]
         )
     
-    # Fallback: calculate from slot status
-    total_slots = db.query(ParkingSlot).filter(
+    # Fallback for lots that never reported: calculate from slot status
+    total_slots, occupied_slots = db.query(
+        func.count(ParkingSlot.id),
+        func.count(ParkingSlot.id).filter(ParkingSlot.status.in_([SlotStatus.OCCUPIED, SlotStatus.RESERVED]))
+    ).filter(
         ParkingSlot.lot_id == lot_id,
         ParkingSlot.is_active == True
-    ).count()
-    
-    occupied_slots = db.query(ParkingSlot).filter(
-        and_(
-            ParkingSlot.lot_id == lot_id,
-            ParkingSlot.is_active == True,
-            ParkingSlot.status.in_([SlotStatus.OCCUPIED, SlotStatus.RESERVED])
-        )
-    ).count()
+    ).one()
     
     return OccupancyData(
         lot_id=lot_id,
@@ -91,21 +220,74 @@ async def get_latest_occupancy(
     )
 
 
+@router.get("/lot/{lot_id}/recent", response_model=OccupancySeries)
+async def get_recent_occupancy(
+    lot_id: int,
+    minutes: int = Query(60, ge=1, le=settings.OCCUPANCY_RING_HOURS * 60)
+):
+    """Columnar occupancy series for charts, served from the in-memory ring buffer"""
+    
+    if lot_id not in await lot_id_cache.valid_ids([lot_id]):
+        raise HTTPException(status_code=404, detail="Parking lot not found")
+    
+    timestamps, counts = recent_occupancy.window(lot_id, minutes)
+    return OccupancySeries(
+        lot_id=lot_id,
+        total_capacity=recent_occupancy.total_capacity(lot_id),
+        timestamps=timestamps.tolist(),
+        occupied_counts=counts.tolist()
+    )
+
+
 @router.get("/lot/{lot_id}", response_model=List[OccupancyData])
 async def get_occupancy_history(
     lot_id: int,
-    hours: int = 24,
+    hours: int = Query(24, ge=1, le=24 * 365),
     db: Session = Depends(get_db)
 ):
-    """Get occupancy history for a parking lot"""
+    """Get occupancy history for a parking lot, downsampled to a rollup for long windows"""
     
     # Check lot exists
     lot = db.query(ParkingLot).filter(ParkingLot.id == lot_id).first()
     if not lot:
         raise HTTPException(status_code=404, detail="Parking lot not found")
     
-    # Get logs from last N hours
     since = datetime.utcnow() - timedelta(hours=hours)
+    
+    # Long windows read the coarsest useful continuous aggregate instead of raw readings
+    rollup = None
+    if settings.TIMESCALE_ENABLED:
+        rollup = choose_rollup(hours, settings.OCCUPANCY_HISTORY_RAW_HOURS, settings.OCCUPANCY_HISTORY_MAX_POINTS)
+    
+    if rollup is not None:
+        rows = db.execute(
+            text(f"""
+                SELECT bucket, avg_occupied, min_occupied, max_occupied, total_capacity, samples
+                FROM {rollup.view}
+                WHERE lot_id = :lot_id AND bucket >= :since
+                ORDER BY bucket
+            """),
+            {"lot_id": lot_id, "since": since}
+        ).all()
+        
+        return [
+            OccupancyData(
+                lot_id=lot_id,
+                timestamp=row.bucket,
+                occupied_count=round(row.avg_occupied),
+                total_capacity=row.total_capacity,
+                occupancy_rate=float(row.avg_occupied) / row.total_capacity if row.total_capacity > 0 else 0,
+                sensor_data={
+                    "resolution": rollup.bucket,
+                    "min_occupied": row.min_occupied,
+                    "max_occupied": row.max_occupied,
+                    "samples": row.samples
+                }
+            )
+            for row in rows
+        ]
+    
+    # Get logs from last N hours
     logs = db.query(OccupancyLog).filter(
         and_(
             OccupancyLog.lot_id == lot_id,
@@ -124,3 +306,38 @@ async def get_occupancy_history(
         )
         for log in logs
     ]
+
+
+def _as_utc(ts: datetime) -> datetime:
+    """Naive UTC, as used for timestamps throughout the API"""
+    if ts.tzinfo is not None:
+        return ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+@router.get("/export")
+async def export_occupancy(
+    start: datetime,
+    end: Optional[datetime] = None,
+    lot_id: Optional[List[int]] = Query(None),
+    format: ExportFormat = ExportFormat.NDJSON,
+    current_user: User = Depends(require_admin)
+):
+    """Stream raw occupancy readings for a time range as NDJSON, CSV or Arrow IPC (admin only)"""
+    
+    start = _as_utc(start)
+    end = _as_utc(end) if end else datetime.utcnow()
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    
+    if format == ExportFormat.ARROW and not arrow_available():
+        raise HTTPException(status_code=501, detail="Arrow export requires pyarrow")
+    
+    chunks = iter_occupancy_chunks(start, end, lot_id, settings.OCCUPANCY_EXPORT_CHUNK_ROWS)
+    filename = f"occupancy_{start:%Y%m%dT%H%M}_{end:%Y%m%dT%H%M}.{format.value}"
+    
+    return StreamingResponse(
+        ENCODERS[format](chunks),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
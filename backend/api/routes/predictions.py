@@ -1,15 +1,21 @@
 """Predictions Routes"""
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
+from sqlalchemy import func
 from datetime import datetime, timedelta
 from typing import Optional
-import os
-import pickle
-import pandas as pd
 
+from core.config import settings
 from core.database import get_db
-from models.models import ParkingLot, OccupancyLog, PredictionLog
-from schemas.schemas import DemandForecast
+from models.models import ParkingLot, PredictionLog
+from schemas.schemas import (
+    DemandForecast, DemandForecastBatchRequest, DemandForecastBatch,
+    ForecastAccuracy, ForecastAccuracyReport, ForecastModelCacheMetrics
+)
+from services.forecast_service import (
+    forecast_store, forecast_lot, forecast_lots, prediction_log_writer, prediction_log_row
+)
+from services.forecast_model_cache import prophet_model_cache
 
 router = APIRouter()
 
@@ -17,102 +23,151 @@ router = APIRouter()
 @router.get("/demand", response_model=DemandForecast)
 async def get_demand_forecast(
     lot_id: int = Query(..., description="Parking lot ID"),
-    horizon_minutes: int = Query(60, description="Forecast horizon in minutes"),
+    horizon_minutes: int = Query(60, ge=15, le=settings.FORECAST_MAX_HORIZON_MINUTES, description="Forecast horizon in minutes"),
     db: Session = Depends(get_db)
 ):
     """Get demand forecast for a parking lot"""
     
+    # Serve from the precomputed forecast store when it covers the window
+    cached = forecast_store.get(lot_id)
+    if cached:
+        predictions = cached.slice(horizon_minutes)
+        if predictions is not None:
+            return DemandForecast(
+                lot_id=lot_id,
+                generated_at=cached.generated_at,
+                horizon_minutes=horizon_minutes,
+                predictions=predictions,
+                model_version=cached.model_version
+            )
+    
     # Validate lot exists
     lot = db.query(ParkingLot).filter(ParkingLot.id == lot_id).first()
     if not lot:
         raise HTTPException(status_code=404, detail="Parking lot not found")
     
-    # Try to load ML model
-    model_path = f"models/prophet_lot_{lot_id}.pkl"
-    
     try:
-        if os.path.exists(model_path):
-            with open(model_path, 'rb') as f:
-                model = pickle.load(f)
-            
-            # Generate future timestamps
-            now = datetime.utcnow()
-            future_timestamps = [now + timedelta(minutes=i*15) for i in range(horizon_minutes // 15)]
-            
-            # Create future dataframe for Prophet
-            future_df = pd.DataFrame({
-                'ds': future_timestamps
-            })
-            
-            # Make prediction
-            forecast = model.predict(future_df)
-            
-            predictions = [
-                {
-                    "timestamp": ts.isoformat(),
-                    "predicted_occupancy": max(0, min(lot.total_slots, int(pred))),
-                    "confidence_lower": max(0, int(lower)),
-                    "confidence_upper": min(lot.total_slots, int(upper))
-                }
-                for ts, pred, lower, upper in zip(
-                    future_timestamps,
-                    forecast['yhat'],
-                    forecast['yhat_lower'],
-                    forecast['yhat_upper']
-                )
-            ]
-            
-            # Log prediction
-            pred_log = PredictionLog(
-                lot_id=lot_id,
-                prediction_time=now,
-                horizon_minutes=horizon_minutes,
-                model_version="prophet_v1",
-                predictions=predictions
-            )
-            db.add(pred_log)
-            db.commit()
-            
-            return DemandForecast(
-                lot_id=lot_id,
-                generated_at=now,
-                horizon_minutes=horizon_minutes,
-                predictions=predictions,
-                model_version="prophet_v1"
-            )
+        # Store miss: compute the full horizon now so later requests hit the store
+        forecast = await forecast_lot(db, lot)
+        now = forecast.generated_at
+        predictions = forecast.slice(horizon_minutes, now)
         
-        else:
-            # Fallback: simple historical average
-            hour_ago = datetime.utcnow() - timedelta(hours=1)
-            recent_logs = db.query(OccupancyLog).filter(
-                OccupancyLog.lot_id == lot_id,
-                OccupancyLog.timestamp >= hour_ago
-            ).all()
-            
-            if recent_logs:
-                avg_occupancy = sum(log.occupied_count for log in recent_logs) / len(recent_logs)
-            else:
-                avg_occupancy = lot.total_slots * 0.5  # Default to 50%
+        # Log prediction without waiting on the database
+        prediction_log_writer.offer(prediction_log_row(forecast, horizon_minutes, predictions))
+        
+        return DemandForecast(
+            lot_id=lot_id,
+            generated_at=now,
+            horizon_minutes=horizon_minutes,
+            predictions=predictions,
+            model_version=forecast.model_version
+        )
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
+
+
+@router.post("/demand/batch", response_model=DemandForecastBatch)
+async def get_demand_forecast_batch(
+    request: DemandForecastBatchRequest,
+    db: Session = Depends(get_db)
+):
+    """Get demand forecasts for many parking lots in one call"""
+    
+    lot_ids = list(dict.fromkeys(request.lot_ids))
+    now = datetime.utcnow()
+    results = {}
+    misses = []
+    
+    # Serve everything the forecast store covers
+    for lot_id in lot_ids:
+        cached = forecast_store.get(lot_id)
+        predictions = cached.slice(request.horizon_minutes, now) if cached else None
+        if predictions is None:
+            misses.append(lot_id)
+            continue
+        
+        results[lot_id] = DemandForecast(
+            lot_id=lot_id,
+            generated_at=cached.generated_at,
+            horizon_minutes=request.horizon_minutes,
+            predictions=predictions,
+            model_version=cached.model_version
+        )
+    
+    # Compute the rest together with a single lot lookup
+    if misses:
+        lots = db.query(ParkingLot).filter(ParkingLot.id.in_(misses)).all()
+        try:
+            computed = await forecast_lots(db, lots)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
+        
+        for forecast in computed:
+            predictions = forecast.slice(request.horizon_minutes, forecast.generated_at)
+            if predictions is None:
+                continue
             
-            # Generate simple forecast
-            now = datetime.utcnow()
-            predictions = [
-                {
-                    "timestamp": (now + timedelta(minutes=i*15)).isoformat(),
-                    "predicted_occupancy": int(avg_occupancy),
-                    "confidence_lower": max(0, int(avg_occupancy * 0.8)),
-                    "confidence_upper": min(lot.total_slots, int(avg_occupancy * 1.2))
-                }
-                for i in range(horizon_minutes // 15)
-            ]
+            # Log prediction without waiting on the database, as the single-lot endpoint does
+            prediction_log_writer.offer(prediction_log_row(forecast, request.horizon_minutes, predictions))
             
-            return DemandForecast(
-                lot_id=lot_id,
-                generated_at=now,
-                horizon_minutes=horizon_minutes,
+            results[forecast.lot_id] = DemandForecast(
+                lot_id=forecast.lot_id,
+                generated_at=forecast.generated_at,
+                horizon_minutes=request.horizon_minutes,
                 predictions=predictions,
-                model_version="simple_average"
+                model_version=forecast.model_version
             )
     
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
+    return DemandForecastBatch(
+        horizon_minutes=request.horizon_minutes,
+        forecasts=[results[lot_id] for lot_id in lot_ids if lot_id in results],
+        missing_lot_ids=[lot_id for lot_id in lot_ids if lot_id not in results]
+    )
+
+
+@router.get("/accuracy", response_model=ForecastAccuracyReport)
+async def get_forecast_accuracy(
+    lot_id: Optional[int] = Query(None, description="Restrict to one parking lot"),
+    days: int = Query(7, ge=1, le=90, description="Look back this many days of evaluated forecasts"),
+    db: Session = Depends(get_db)
+):
+    """Summarize evaluated forecast accuracy per model version and per lot"""
+    
+    since = datetime.utcnow() - timedelta(days=days)
+    filters = [PredictionLog.mae.isnot(None), PredictionLog.generated_at >= since]
+    if lot_id is not None:
+        filters.append(PredictionLog.lot_id == lot_id)
+    
+    metrics = (
+        func.count(PredictionLog.id),
+        func.avg(PredictionLog.mae),
+        # Pool RMSE across logs as the root of the mean squared error
+        func.sqrt(func.avg(PredictionLog.rmse * PredictionLog.rmse))
+    )
+    
+    by_model_version = db.query(PredictionLog.model_version, *metrics).filter(
+        *filters
+    ).group_by(PredictionLog.model_version).all()
+    
+    by_lot = db.query(PredictionLog.lot_id, PredictionLog.model_version, *metrics).filter(
+        *filters
+    ).group_by(PredictionLog.lot_id, PredictionLog.model_version).order_by(PredictionLog.lot_id).all()
+    
+    return ForecastAccuracyReport(
+        since=since,
+        by_model_version=[
+            ForecastAccuracy(model_version=version, evaluated=count, mae=mae, rmse=rmse)
+            for version, count, mae, rmse in by_model_version
+        ],
+        by_lot=[
+            ForecastAccuracy(lot_id=lot, model_version=version, evaluated=count, mae=mae, rmse=rmse)
+            for lot, version, count, mae, rmse in by_lot
+        ]
+    )
+
+
+@router.get("/models/metrics", response_model=ForecastModelCacheMetrics)
+async def get_model_cache_metrics():
+    """Prophet model cache size and hit/miss/eviction counts"""
+    return ForecastModelCacheMetrics(**prophet_model_cache.stats())
@@ -0,0 +1,80 @@
+"""
+Broadcast Encoding Benchmark for ParkPulse
+Compares encoding a lot broadcast per subscriber (send_json on every
+socket) with encoding it once and queueing the same text for every socket
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+# Add the backend directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.websocket_manager import ClientConnection, encode_message, orjson
+
+
+def occupancy_message(lot_id: int, i: int) -> dict:
+    """A typical occupancy broadcast, varied so nothing is cached between rounds"""
+    return {
+        "type": "occupancy_update",
+        "lot_id": str(lot_id),
+        "data": {
+            "lot_id": lot_id,
+            "timestamp": f"2024-01-01T12:00:{i % 60:02d}",
+            "occupied_count": i % 250,
+            "total_capacity": 250,
+            "occupancy_rate": (i % 250) / 250
+        }
+    }
+
+
+def per_subscriber(message: dict, subscribers: int):
+    # What Starlette's send_json does for each socket
+    for _ in range(subscribers):
+        json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+def encode_once(message: dict, clients):
+    text = encode_message(message)
+    for client in clients:
+        client.enqueue(text)
+
+
+def cpu_per_broadcast(fn, rounds: int) -> float:
+    started = time.process_time()
+    for i in range(rounds):
+        fn(i)
+    return (time.process_time() - started) / rounds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure per-broadcast CPU of WebSocket fan-out encoding")
+    parser.add_argument("--subscribers", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    clients = [
+        ClientConnection(None, on_evict=lambda client: None, max_pending=100, send_timeout=5, evict_after=30)
+        for _ in range(args.subscribers)
+    ]
+
+    print("=" * 60)
+    print("ParkPulse Broadcast Encoding Benchmark")
+    print("=" * 60)
+    print(f"Subscribers: {args.subscribers}, rounds: {args.rounds}, encoder: {'orjson' if orjson else 'json'}")
+
+    before = cpu_per_broadcast(lambda i: per_subscriber(occupancy_message(1, i), args.subscribers), args.rounds)
+    after = cpu_per_broadcast(lambda i: encode_once(occupancy_message(1, i), clients), args.rounds)
+
+    print(f"\nEncode per subscriber: {before * 1000:8.2f} ms CPU per broadcast")
+    print(f"Encode once + enqueue: {after * 1000:8.2f} ms CPU per broadcast")
+    print(f"Reduction:             {before / after:8.1f}x")
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
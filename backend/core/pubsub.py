@@ -0,0 +1,200 @@
+"""
+Pub/Sub Backbone
+Carries WebSocket broadcasts between workers: a message is published once
+and every worker fans it out to the sockets it holds
+"""
+
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, List, Optional, Set
+
+from core.config import settings
+from core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "ws:"
+
+Handler = Callable[[str, dict], Awaitable[None]]
+
+
+class LocalPubSub:
+    """Delivers messages within this process (single worker, tests)"""
+
+    distributed = False
+
+    def __init__(self):
+        self._handlers: List[Handler] = []
+
+    def subscribe(self, handler: Handler):
+        """Receive every message on the channels this worker listens to as ``handler(channel, message)``"""
+        self._handlers.append(handler)
+
+    def listen(self, channel: str):
+        """Start receiving a per-topic channel (while this worker has subscribers for it)"""
+
+    def unlisten(self, channel: str):
+        """Stop receiving a channel passed to ``listen``"""
+
+    async def ensure_listening(self, channel: str):
+        """``listen``, returning once the subscription is in place"""
+        self.listen(channel)
+
+    def has_listeners(self, channel: str) -> bool:
+        """Whether another worker may be listening to a channel"""
+        return False
+
+    async def publish(self, channel: str, message: dict):
+        for handler in self._handlers:
+            await self._dispatch(handler, channel, message)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    @staticmethod
+    async def _dispatch(handler: Handler, channel: str, message: dict):
+        try:
+            await handler(channel, message)
+        except Exception as e:
+            logger.error(f"Pub/sub handler failed on {channel}: {e}", exc_info=True)
+
+
+class RedisPubSub(LocalPubSub):
+    """
+    Publishes to Redis channels under ``ws:``
+
+    Every worker receives ``global`` and ``user:*`` messages; per-topic
+    channels are subscribed only while the worker holds a subscriber, so
+    it never decodes traffic for lots nobody on it is watching. Channels
+    with a listener on any worker are refreshed every ``refresh_seconds``
+    so publishers can skip topics nobody watches. Each worker receives its
+    own messages back from Redis, so local delivery happens in one place.
+    The listener reconnects after errors; messages published while it is
+    down are lost, as with any Redis pub/sub.
+    """
+
+    distributed = True
+
+    def __init__(self, reconnect_seconds: float = 1.0, refresh_seconds: float = 1.0):
+        super().__init__()
+        self.reconnect_seconds = reconnect_seconds
+        self.refresh_seconds = refresh_seconds
+        self._task: Optional[asyncio.Task] = None
+        self._sync_task: Optional[asyncio.Task] = None
+        self._pubsub = None
+        # Per-topic channels wanted here, and those the connection is subscribed to
+        self._channels: Set[str] = set()
+        self._subscribed: Set[str] = set()
+        self._changed = asyncio.Event()
+        # Per-topic channels with a listener on any worker, as of the last refresh
+        self._remote: Set[str] = set()
+
+        # Counters for monitoring
+        self.published = 0
+        self.received = 0
+
+    def listen(self, channel: str):
+        self._channels.add(channel)
+        self._changed.set()
+
+    def unlisten(self, channel: str):
+        self._channels.discard(channel)
+        self._changed.set()
+
+    async def ensure_listening(self, channel: str):
+        self.listen(channel)
+        pubsub = self._pubsub
+        if pubsub is not None and channel not in self._subscribed:
+            try:
+                await pubsub.subscribe(CHANNEL_PREFIX + channel)
+                self._subscribed.add(channel)
+            except Exception as e:
+                logger.error(f"Failed to subscribe to {channel}: {e}")
+
+    def has_listeners(self, channel: str) -> bool:
+        return channel in self._channels or channel in self._remote
+
+    async def publish(self, channel: str, message: dict):
+        try:
+            receivers = await get_redis().publish(CHANNEL_PREFIX + channel, json.dumps(message))
+            self.published += 1
+            if not receivers:
+                self._remote.discard(channel)
+        except Exception as e:
+            logger.error(f"Failed to publish to {channel}: {e}")
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+            self._sync_task = asyncio.create_task(self._sync())
+
+    async def stop(self):
+        if self._task is not None:
+            for task in (self._task, self._sync_task):
+                task.cancel()
+            await asyncio.gather(self._task, self._sync_task, return_exceptions=True)
+            self._task = self._sync_task = None
+
+    async def _listen(self):
+        while True:
+            pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(CHANNEL_PREFIX + "global")
+                await pubsub.psubscribe(CHANNEL_PREFIX + "user:*")
+                self._pubsub = pubsub
+                self._subscribed = set()
+                self._changed.set()
+                logger.info("Subscribed to WebSocket channels in Redis")
+                async for item in pubsub.listen():
+                    if item["type"] not in ("message", "pmessage"):
+                        continue
+                    self.received += 1
+                    channel = item["channel"][len(CHANNEL_PREFIX):]
+                    message = json.loads(item["data"])
+                    for handler in self._handlers:
+                        await self._dispatch(handler, channel, message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Redis pub/sub listener failed, reconnecting: {e}")
+                await asyncio.sleep(self.reconnect_seconds)
+            finally:
+                self._pubsub = None
+                await pubsub.aclose()
+
+    async def _sync(self):
+        """Apply listen/unlisten calls to the connection and refresh the channels watched elsewhere"""
+        while True:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=self.refresh_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._changed.clear()
+            try:
+                pubsub = self._pubsub
+                if pubsub is not None:
+                    added = self._channels - self._subscribed
+                    removed = self._subscribed - self._channels
+                    if added:
+                        await pubsub.subscribe(*(CHANNEL_PREFIX + channel for channel in added))
+                    if removed:
+                        await pubsub.unsubscribe(*(CHANNEL_PREFIX + channel for channel in removed))
+                    self._subscribed = (self._subscribed | added) - removed
+                watched = await get_redis().pubsub_channels(CHANNEL_PREFIX + "topic:*")
+                self._remote = {channel[len(CHANNEL_PREFIX):] for channel in watched}
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to update Redis channel subscriptions: {e}")
+                await asyncio.sleep(self.reconnect_seconds)
+
+
+def create_pubsub() -> LocalPubSub:
+    """Redis-backed when REDIS_ENABLED is on, otherwise process-local"""
+    if get_redis() is not None:
+        return RedisPubSub(refresh_seconds=settings.WEBSOCKET_TOPIC_REFRESH_SECONDS)
+    return LocalPubSub()
@@ -0,0 +1,29 @@
+"""
+Redis Client
+Shared asyncio Redis connection for state that must be visible to every worker
+"""
+
+from typing import Optional
+
+import redis.asyncio as redis
+
+from core.config import settings
+
+_client: Optional[redis.Redis] = None
+
+
+def get_redis() -> Optional[redis.Redis]:
+    """The shared client, or None when REDIS_ENABLED is off (single-worker setups)"""
+    global _client
+    if not settings.REDIS_ENABLED:
+        return None
+    if _client is None:
+        _client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _client
+
+
+async def close_redis():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,156 @@
+"""
+TimescaleDB Setup for Occupancy History
+Turns occupancy_logs into a hypertable and maintains 1-minute, 15-minute
+and 1-hour continuous aggregates for history queries, with compression
+and retention policies
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import List, Optional
+
+from sqlalchemy import text
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CHUNK_INTERVAL = "1 day"
+
+
+@dataclass(frozen=True)
+class OccupancyRollup:
+    """A continuous aggregate of occupancy_logs and its refresh policy"""
+    view: str
+    bucket: str
+    bucket_seconds: int
+    start_offset: str
+    schedule: str
+
+
+# Finest first
+OCCUPANCY_ROLLUPS: List[OccupancyRollup] = [
+    OccupancyRollup("occupancy_1m", "1 minute", 60, "2 hours", "1 minute"),
+    OccupancyRollup("occupancy_15m", "15 minutes", 900, "1 day", "15 minutes"),
+    OccupancyRollup("occupancy_1h", "1 hour", 3600, "3 days", "1 hour"),
+]
+
+
+def choose_rollup(hours: int, raw_hours: int, max_points: int) -> Optional[OccupancyRollup]:
+    """
+    Pick the source for a history window of ``hours``
+
+    Short windows read raw readings (None). Longer ones use the finest rollup
+    that returns at most ``max_points`` buckets, falling back to the
+    coarsest rollup when none does.
+    """
+    if hours <= raw_hours:
+        return None
+    for rollup in OCCUPANCY_ROLLUPS:
+        if hours * 3600 // rollup.bucket_seconds <= max_points:
+            return rollup
+    return OCCUPANCY_ROLLUPS[-1]
+
+
+def _is_hypertable(conn) -> bool:
+    return conn.execute(text(
+        "SELECT 1 FROM timescaledb_information.hypertables WHERE hypertable_name = 'occupancy_logs'"
+    )).first() is not None
+
+
+def _rollup_exists(conn, rollup: OccupancyRollup) -> bool:
+    return conn.execute(
+        text("SELECT 1 FROM timescaledb_information.continuous_aggregates WHERE view_name = :view"),
+        {"view": rollup.view}
+    ).first() is not None
+
+
+def _create_rollup(conn, rollup: OccupancyRollup):
+    conn.execute(text(f"""
+        CREATE MATERIALIZED VIEW {rollup.view}
+        WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+        SELECT
+            lot_id,
+            time_bucket(INTERVAL '{rollup.bucket}', timestamp) AS bucket,
+            avg(occupied_count) AS avg_occupied,
+            min(occupied_count) AS min_occupied,
+            max(occupied_count) AS max_occupied,
+            max(total_capacity) AS total_capacity,
+            count(*) AS samples
+        FROM occupancy_logs
+        GROUP BY lot_id, bucket
+        WITH NO DATA
+    """))
+    conn.execute(text(f"""
+        SELECT add_continuous_aggregate_policy(
+            '{rollup.view}',
+            start_offset => INTERVAL '{rollup.start_offset}',
+            end_offset => INTERVAL '{rollup.bucket}',
+            schedule_interval => INTERVAL '{rollup.schedule}',
+            if_not_exists => TRUE
+        )
+    """))
+    # Materialize existing history once; the policy keeps it current afterwards
+    conn.execute(text(f"CALL refresh_continuous_aggregate('{rollup.view}', NULL, NULL)"))
+
+
+def _replace_policy(conn, kind: str, relation: str, interval_arg: str, days: int):
+    """Drop and re-add a policy so changed settings take effect"""
+    conn.execute(text(f"SELECT remove_{kind}_policy('{relation}', if_exists => TRUE)"))
+    conn.execute(text(f"SELECT add_{kind}_policy('{relation}', {interval_arg} => INTERVAL '{days} days')"))
+
+
+def _apply_storage_policies(conn):
+    """Native compression of older raw chunks, and retention for raw data and rollups"""
+    compressed = conn.execute(text(
+        "SELECT 1 FROM timescaledb_information.compression_settings WHERE hypertable_name = 'occupancy_logs'"
+    )).first()
+    if compressed is None:
+        conn.execute(text("""
+            ALTER TABLE occupancy_logs SET (
+                timescaledb.compress,
+                timescaledb.compress_segmentby = 'lot_id',
+                timescaledb.compress_orderby = 'timestamp DESC'
+            )
+        """))
+
+    _replace_policy(conn, "compression", "occupancy_logs", "compress_after", settings.OCCUPANCY_COMPRESS_AFTER_DAYS)
+    _replace_policy(conn, "retention", "occupancy_logs", "drop_after", settings.OCCUPANCY_RAW_RETENTION_DAYS)
+    for rollup in OCCUPANCY_ROLLUPS:
+        _replace_policy(conn, "retention", rollup.view, "drop_after", settings.OCCUPANCY_ROLLUP_RETENTION_DAYS)
+
+
+def setup_occupancy_timescale(engine):
+    """
+    Idempotently convert occupancy_logs to a hypertable, create its rollups
+    and (re)apply compression and retention policies
+
+    Tables created before the switch have a primary key on ``id`` alone;
+    it is widened to (id, timestamp) and existing rows are migrated into
+    chunks.
+    """
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS timescaledb"))
+
+        if not _is_hypertable(conn):
+            conn.execute(text("ALTER TABLE occupancy_logs DROP CONSTRAINT IF EXISTS occupancy_logs_pkey"))
+            conn.execute(text("ALTER TABLE occupancy_logs ADD PRIMARY KEY (id, timestamp)"))
+            conn.execute(text(f"""
+                SELECT create_hypertable(
+                    'occupancy_logs', 'timestamp',
+                    chunk_time_interval => INTERVAL '{CHUNK_INTERVAL}',
+                    migrate_data => TRUE,
+                    if_not_exists => TRUE
+                )
+            """))
+            logger.info("Converted occupancy_logs to a hypertable")
+
+    # Continuous aggregates cannot be created inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for rollup in OCCUPANCY_ROLLUPS:
+            if not _rollup_exists(conn, rollup):
+                _create_rollup(conn, rollup)
+                logger.info(f"Created continuous aggregate {rollup.view}")
+        _apply_storage_policies(conn)
+
+    logger.info(f"Occupancy rollups ready: {', '.join(r.view for r in OCCUPANCY_ROLLUPS)}")
@@ -2,88 +2,389 @@
 WebSocket Connection Manager for Real-time Updates
 """
 
-from fastapi import WebSocket
-from typing import Dict, List, Set, Optional
+from fastapi import WebSocket, status
+from collections import deque
+from typing import Any, Deque, Dict, Set, Optional, Tuple
+import asyncio
 import json
 import logging
+import time
+
+from core.config import settings
+from core.pubsub import create_pubsub
+
+try:
+    import orjson
+except ImportError:  # Falls back to the standard library encoder
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
 
+def encode_message(message: dict) -> str:
+    """JSON text of a message (compact, as ``send_json`` would send it)"""
+    if orjson is not None:
+        return orjson.dumps(message).decode()
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+class ClientConnection:
+    """
+    One WebSocket with a bounded outbound queue drained by its own task
+
+    Messages are queued already encoded, so a broadcast is serialized once
+    for all its subscribers. Messages with a ``key`` (latest-state updates such as occupancy) replace
+    a pending message with the same key instead of queueing behind it. When
+    the queue is full the oldest message is dropped. A client whose queue
+    stays full for ``evict_after`` seconds, or whose send takes longer than
+    ``send_timeout``, is disconnected.
+    """
+    
+    def __init__(self, websocket: WebSocket, on_evict, max_pending: int,
+                 send_timeout: float, evict_after: float, user_id: Optional[str] = None):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.topics: Set[str] = set()
+        self.max_pending = max_pending
+        self.send_timeout = send_timeout
+        self.evict_after = evict_after
+        self._on_evict = on_evict
+        self._queue: Deque[Tuple[Optional[Any], Optional[str]]] = deque()
+        self._latest: Dict[Any, str] = {}
+        self._ready = asyncio.Event()
+        self._full_since: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self.closed = False
+        
+        # Counters for monitoring
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+    
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+    
+    def enqueue(self, text: str, key: Optional[Any] = None) -> bool:
+        """Queue an encoded message without waiting; returns False if the client was evicted"""
+        if self.closed:
+            return False
+        
+        if key is not None and key in self._latest:
+            self._latest[key] = text
+            self.coalesced += 1
+            return True
+        
+        if len(self._queue) >= self.max_pending:
+            now = time.monotonic()
+            if self._full_since is None:
+                self._full_since = now
+            elif now - self._full_since > self.evict_after:
+                self._evict(f"send queue full for over {self.evict_after:g}s")
+                return False
+            old_key, _ = self._queue.popleft()
+            if old_key is not None:
+                self._latest.pop(old_key, None)
+            self.dropped += 1
+        
+        if key is not None:
+            self._latest[key] = text
+            self._queue.append((key, None))
+        else:
+            self._queue.append((None, text))
+        self._ready.set()
+        return True
+    
+    def close(self):
+        """Stop the writer; pending messages are discarded"""
+        self.closed = True
+        self._queue.clear()
+        self._latest.clear()
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+    
+    async def _run(self):
+        while not self.closed:
+            if not self._queue:
+                self._full_since = None
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            
+            key, text = self._queue.popleft()
+            if key is not None:
+                text = self._latest.pop(key)
+            try:
+                await asyncio.wait_for(self.websocket.send_text(text), self.send_timeout)
+            except asyncio.TimeoutError:
+                self._evict(f"send took over {self.send_timeout:g}s")
+                await self._close_socket()
+                return
+            except Exception as e:
+                logger.error(f"Error sending WebSocket message: {e}")
+                self._evict("send failed")
+                return
+            self.sent += 1
+    
+    def _evict(self, reason: str):
+        logger.warning(f"Evicting slow WebSocket client: {reason} ({self.dropped} messages dropped)")
+        self.close()
+        self._on_evict(self)
+        if asyncio.current_task() is not self._task:
+            asyncio.create_task(self._close_socket())
+    
+    async def _close_socket(self):
+        try:
+            await self.websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        except Exception:
+            pass
+
+
+LOT_TOPICS = ("occupancy", "pricing", "slots")
+
+
+def parse_topic(topic: str) -> Optional[Tuple[str, int]]:
+    """(kind, lot_id) of a topic such as ``occupancy:12``, or None if it is not one"""
+    kind, _, lot_id = topic.partition(":")
+    # isdigit() alone accepts Unicode digits such as "²" that int() rejects
+    if kind not in LOT_TOPICS or not (lot_id.isascii() and lot_id.isdigit()):
+        return None
+    return kind, int(lot_id)
+
+
+def lot_topic(kind: str, lot_id) -> str:
+    return f"{kind}:{lot_id}"
+
+
 class ConnectionManager:
-    """Manages WebSocket connections for real-time updates"""
+    """
+    Manages WebSocket connections for real-time updates
+    
+    Lot updates are published per topic (``occupancy:<lot>``,
+    ``pricing:<lot>``, ``slots:<lot>``) and one connection may subscribe
+    to any number of topics. Broadcasts go through the pub/sub backbone and
+    are delivered to local sockets when they come back, so with Redis
+    enabled every worker reaches the subscribers it holds.
+    """
     
     def __init__(self):
-        # lot_id -> list of active connections
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+        # topic -> subscribed connections
+        self.topics: Dict[str, Set[WebSocket]] = {}
         # Global connections (not specific to a lot)
         self.global_connections: Set[WebSocket] = set()
+        # websocket -> its outbound queue and writer
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        # user_id -> that user's authenticated connections
+        self.user_connections: Dict[str, Set[WebSocket]] = {}
+        self.evicted = 0
+        # Counters of closed connections, so stats() stays cumulative
+        self._closed_counts = {"sent": 0, "coalesced": 0, "dropped": 0}
+        self.pubsub = create_pubsub()
+        self.pubsub.subscribe(self._deliver)
     
-    async def connect(self, websocket: WebSocket, lot_id: Optional[str] = None):
-        """Accept and store a new WebSocket connection"""
+    async def connect(self, websocket: WebSocket, lot_id: Optional[str] = None,
+                      user_id: Optional[str] = None, receive_global: bool = True):
+        """
+        Accept and store a new WebSocket connection, indexed by user when authenticated
+        
+        With ``lot_id`` the connection subscribes to every topic of that lot.
+        Otherwise it receives global broadcasts unless ``receive_global`` is
+        off (streams with their own subscriptions).
+        """
         await websocket.accept()
         
+        client = ClientConnection(
+            websocket,
+            on_evict=self._evict,
+            max_pending=settings.WEBSOCKET_SEND_QUEUE_SIZE,
+            send_timeout=settings.WEBSOCKET_SEND_TIMEOUT_SECONDS,
+            evict_after=settings.WEBSOCKET_SLOW_CONSUMER_SECONDS,
+            user_id=user_id
+        )
+        self.clients[websocket] = client
+        client.start()
+        if user_id:
+            self.user_connections.setdefault(user_id, set()).add(websocket)
+        
         if lot_id:
-            if lot_id not in self.active_connections:
-                self.active_connections[lot_id] = []
-            self.active_connections[lot_id].append(websocket)
-            logger.info(f"Client connected to lot {lot_id}. Total connections: {len(self.active_connections[lot_id])}")
-        else:
+            for kind in LOT_TOPICS:
+                self.subscribe(websocket, lot_topic(kind, lot_id))
+            logger.info(f"Client connected to lot {lot_id}. Total connections: {len(self.topics[lot_topic('occupancy', lot_id)])}")
+        elif receive_global:
             self.global_connections.add(websocket)
             logger.info(f"Client connected globally. Total connections: {len(self.global_connections)}")
     
-    def disconnect(self, websocket: WebSocket, lot_id: Optional[str] = None):
-        """Remove a WebSocket connection"""
-        if lot_id and lot_id in self.active_connections:
-            if websocket in self.active_connections[lot_id]:
-                self.active_connections[lot_id].remove(websocket)
-                logger.info(f"Client disconnected from lot {lot_id}")
-                
-                # Clean up empty lot entries
-                if not self.active_connections[lot_id]:
-                    del self.active_connections[lot_id]
-        else:
-            if websocket in self.global_connections:
-                self.global_connections.remove(websocket)
-                logger.info("Client disconnected globally")
+    def disconnect(self, websocket: WebSocket):
+        """Remove a WebSocket connection and all its subscriptions"""
+        client = self.clients.pop(websocket, None)
+        if client is None:
+            return
+        client.close()
+        self._retire(client)
+        
+        for topic in list(client.topics):
+            self.unsubscribe(websocket, topic, client)
+        
+        user_sockets = self.user_connections.get(client.user_id)
+        if user_sockets is not None:
+            user_sockets.discard(websocket)
+            if not user_sockets:
+                del self.user_connections[client.user_id]
+        
+        if websocket in self.global_connections:
+            self.global_connections.remove(websocket)
+            logger.info("Client disconnected globally")
+    
+    def subscribe(self, websocket: WebSocket, topic: str) -> bool:
+        """Add a topic to a connection; False once it holds WEBSOCKET_MAX_TOPICS"""
+        client = self.clients.get(websocket)
+        if client is None:
+            return False
+        if topic in client.topics:
+            return True
+        if len(client.topics) >= settings.WEBSOCKET_MAX_TOPICS:
+            return False
+        client.topics.add(topic)
+        if topic not in self.topics:
+            self.topics[topic] = set()
+            self.pubsub.listen(f"topic:{topic}")
+        self.topics[topic].add(websocket)
+        return True
+    
+    def unsubscribe(self, websocket: WebSocket, topic: str, client: Optional[ClientConnection] = None):
+        client = client or self.clients.get(websocket)
+        if client is not None:
+            client.topics.discard(topic)
+        sockets = self.topics.get(topic)
+        if sockets is not None:
+            sockets.discard(websocket)
+            # Clean up empty topic entries
+            if not sockets:
+                del self.topics[topic]
+                self.pubsub.unlisten(f"topic:{topic}")
+    
+    def handle_client_message(self, websocket: WebSocket, data: str) -> dict:
+        """
+        Apply a control message from a client and return the reply
+        
+        ``{"action": "subscribe" | "unsubscribe", "topics": ["occupancy:12", ...]}``
+        or ``{"action": "ping"}``.
+        """
+        try:
+            command = json.loads(data)
+            action = command["action"]
+        except (ValueError, TypeError, KeyError):
+            return {"type": "error", "detail": "Expected a JSON object with an action"}
+        
+        if action == "ping":
+            return {"type": "pong"}
+        if action not in ("subscribe", "unsubscribe"):
+            return {"type": "error", "detail": f"Unknown action {action}"}
+        
+        topics = command.get("topics")
+        if not isinstance(topics, list) or not all(isinstance(topic, str) for topic in topics):
+            return {"type": "error", "detail": "topics must be a list of strings"}
+        
+        # Topics are stored as publishers name them, so "occupancy:012" means occupancy:12
+        parsed = [(topic, parse_topic(topic)) for topic in topics]
+        
+        if action == "unsubscribe":
+            normalized = [lot_topic(*key) for _, key in parsed if key is not None]
+            for topic in normalized:
+                self.unsubscribe(websocket, topic)
+            return {"type": "unsubscribed", "topics": normalized}
+        
+        accepted, rejected = [], []
+        for topic, key in parsed:
+            if key is not None and self.subscribe(websocket, lot_topic(*key)):
+                accepted.append(lot_topic(*key))
+            else:
+                rejected.append(topic)
+        return {"type": "subscribed", "topics": accepted, "rejected": rejected}
+    
+    def _evict(self, client: ClientConnection):
+        self.evicted += 1
+        self.disconnect(client.websocket)
     
     async def send_personal_message(self, message: dict, websocket: WebSocket):
         """Send a message to a specific WebSocket"""
+        client = self.clients.get(websocket)
+        if client is not None:
+            client.enqueue(encode_message(message))
+            return
         try:
             await websocket.send_json(message)
         except Exception as e:
             logger.error(f"Error sending personal message: {e}")
     
-    async def broadcast_to_lot(self, lot_id: str, message: dict):
-        """Broadcast a message to all connections for a specific lot"""
-        if lot_id not in self.active_connections:
+    def _enqueue_all(self, connections, text: str, key: Optional[Any] = None):
+        # Copy first: an eviction removes the connection from the collection
+        for connection in list(connections):
+            client = self.clients.get(connection)
+            if client is not None:
+                client.enqueue(text, key)
+    
+    def has_subscribers(self, topic: str) -> bool:
+        """Whether a topic broadcast may reach anyone, on this worker or another"""
+        return topic in self.topics or self.pubsub.has_listeners(f"topic:{topic}")
+    
+    async def publish(self, topic: str, message: dict, key: Optional[Any] = None):
+        """Publish a message to all subscribers of a topic; ``key`` coalesces pending updates"""
+        if not self.has_subscribers(topic):
             return
-        
-        disconnected = []
-        for connection in self.active_connections[lot_id]:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"Error broadcasting to lot {lot_id}: {e}")
-                disconnected.append(connection)
-        
-        # Remove disconnected clients
-        for connection in disconnected:
-            self.disconnect(connection, lot_id)
+        await self.pubsub.publish(f"topic:{topic}", {"text": encode_message(message), "key": key})
     
-    async def broadcast_global(self, message: dict):
-        """Broadcast a message to all global connections"""
-        disconnected = []
-        for connection in self.global_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"Error in global broadcast: {e}")
-                disconnected.append(connection)
-        
-        # Remove disconnected clients
-        for connection in disconnected:
-            self.disconnect(connection)
+    async def broadcast_global(self, message: dict, key: Optional[Any] = None):
+        """Publish a message for all global connections"""
+        await self.pubsub.publish("global", {"text": encode_message(message), "key": key})
+    
+    async def send_to_user(self, user_id: str, message: dict):
+        """Publish a message for every connection of one user"""
+        if not self.pubsub.distributed and user_id not in self.user_connections:
+            return
+        await self.pubsub.publish(f"user:{user_id}", {"text": encode_message(message), "key": None})
+    
+    async def _deliver(self, channel: str, payload: dict):
+        """Fan a published message out to this worker's sockets"""
+        if channel == "global":
+            connections = self.global_connections
+        elif channel.startswith("topic:"):
+            connections = self.topics.get(channel[len("topic:"):], ())
+        elif channel.startswith("user:"):
+            connections = self.user_connections.get(channel[len("user:"):], ())
+        else:
+            return
+        self._enqueue_all(connections, payload["text"], payload["key"])
+    
+    def _retire(self, client: ClientConnection):
+        for name in self._closed_counts:
+            self._closed_counts[name] += getattr(client, name)
+    
+    def stats(self) -> dict:
+        """Current connections and queue depth, plus message counters since startup"""
+        return {
+            "connections": len(self.clients),
+            "users": len(self.user_connections),
+            "topics": len(self.topics),
+            "pending": sum(len(client._queue) for client in self.clients.values()),
+            **{
+                name: total + sum(getattr(client, name) for client in self.clients.values())
+                for name, total in self._closed_counts.items()
+            },
+            "evicted": self.evicted
+        }
+    
+    async def start(self):
+        await self.pubsub.start()
+    
+    async def stop(self):
+        """Stop listening for broadcasts and every writer task (on shutdown)"""
+        await self.pubsub.stop()
+        for client in self.clients.values():
+            client.close()
+            self._retire(client)
+        self.clients.clear()
+        self.user_connections.clear()
+        self.topics.clear()
     
     async def send_occupancy_update(self, lot_id: str, occupancy_data: dict):
         """Send occupancy update to all clients watching a specific lot"""
@@ -92,7 +393,9 @@ class ConnectionManager:
             "lot_id": lot_id,
             "data": occupancy_data
         }
-        await self.broadcast_to_lot(lot_id, message)
+        # Coalesce per topic: one connection may watch many lots
+        topic = lot_topic("occupancy", lot_id)
+        await self.publish(topic, message, key=topic)
     
     async def send_booking_notification(self, user_id: str, booking_data: dict):
         """Send booking notification to a specific user (if connected)"""
@@ -100,8 +403,16 @@ class ConnectionManager:
             "type": "booking_notification",
             "data": booking_data
         }
-        # In a real implementation, you'd maintain user_id -> websocket mapping
-        await self.broadcast_global(message)
+        await self.send_to_user(user_id, message)
+    
+    async def send_slot_update(self, lot_id: str, slot_data: dict):
+        """Send slot status changes to all clients watching a specific lot"""
+        message = {
+            "type": "slot_update",
+            "lot_id": lot_id,
+            "data": slot_data
+        }
+        await self.publish(lot_topic("slots", lot_id), message)
     
     async def send_pricing_update(self, lot_id: str, pricing_data: dict):
         """Send dynamic pricing update"""
@@ -110,7 +421,8 @@ class ConnectionManager:
             "lot_id": lot_id,
             "data": pricing_data
         }
-        await self.broadcast_to_lot(lot_id, message)
+        topic = lot_topic("pricing", lot_id)
+        await self.publish(topic, message, key=topic)
 
 
 # Global manager instance
@@ -0,0 +1,160 @@
+"""
+Write-behind Queue for Bulk Inserts
+Buffers rows in memory and writes them in multi-row INSERTs from a background task
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Iterable, List, Optional
+
+from sqlalchemy import insert
+
+from core.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """
+    Bounded in-memory queue of rows for one table
+
+    ``offer`` never blocks: it appends the row and returns False when the
+    queue is full. A background task flushes every ``max_batch`` rows or
+    ``flush_interval`` seconds, whichever comes first, with one multi-row
+    INSERT per batch. Failed batches are retried with exponential backoff
+    and dropped after ``max_retries``. Remaining rows are flushed on ``stop``.
+    """
+
+    def __init__(self, name: str, model, max_batch: int, flush_interval: float, max_pending: int,
+                 max_retries: int = 3, retry_backoff: float = 0.5):
+        self.name = name
+        self.model = model
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        self._pending: deque = deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        # Counters for monitoring
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0  # Accepted rows that were lost
+        self.rejected = 0  # Rows turned away by offer_all, for the caller to retry
+        self.retries = 0
+        self.flushes = 0
+        self.flush_seconds_total = 0.0
+        self.last_flush_seconds = 0.0
+
+    def offer(self, row: dict) -> bool:
+        """Queue a row for insertion; returns False if the queue is full"""
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return False
+
+        self._pending.append(row)
+        self.enqueued += 1
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+        return True
+
+    def offer_many(self, rows: Iterable[dict]) -> int:
+        """Queue several rows; returns how many were accepted"""
+        return sum(1 for row in rows if self.offer(row))
+
+    def offer_all(self, rows: List[dict]) -> bool:
+        """Queue all rows or none of them; returns False if they don't fit"""
+        if len(self._pending) + len(rows) > self.max_pending:
+            self.rejected += len(rows)
+            return False
+
+        self._pending.extend(rows)
+        self.enqueued += len(rows)
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+        return True
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task and flush everything still queued"""
+        if self._task is not None:
+            # Let an in-flight batch finish its retries instead of cancelling it mid-write
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def flush(self):
+        while self._pending:
+            await self._write_with_retry(self._take_batch())
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "max_pending": self.max_pending,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "retries": self.retries,
+            "flushes": self.flushes,
+            "last_flush_ms": round(self.last_flush_seconds * 1000, 2),
+            "avg_flush_ms": round(self.flush_seconds_total / self.flushes * 1000, 2) if self.flushes else 0.0
+        }
+
+    async def _write_with_retry(self, batch: List[dict]):
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.dropped += len(batch)
+                    logger.error(f"Dropping {len(batch)} rows for {self.name} after {attempt + 1} attempts: {e}")
+                    return
+                self.retries += 1
+                logger.warning(f"Write to {self.name} failed, retrying: {e}")
+                await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+            else:
+                elapsed = time.perf_counter() - started
+                self.written += len(batch)
+                self.flushes += 1
+                self.flush_seconds_total += elapsed
+                self.last_flush_seconds = elapsed
+                return
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def _take_batch(self) -> List[dict]:
+        count = min(self.max_batch, len(self._pending))
+        return [self._pending.popleft() for _ in range(count)]
+
+    def _write(self, batch: List[dict]):
+        db = SessionLocal()
+        try:
+            db.execute(insert(self.model), batch)
+            db.commit()
+        finally:
+            db.close()
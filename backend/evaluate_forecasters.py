@@ -0,0 +1,100 @@
+"""
+Forecast Accuracy Comparison for ParkPulse
+Backtests the vectorized fleet forecaster against per-lot Prophet models
+"""
+
+import argparse
+import os
+import pickle
+import sys
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.config import settings
+from core.database import SessionLocal
+from services.fleet_forecaster import BUCKET_SECONDS, EPOCH, OccupancyMatrix, backtest
+from services.forecast_model_cache import prophet_model_cache
+
+
+def prophet_backtest(matrix, holdout_buckets):
+    """Score each lot that has a Prophet pickle on the same holdout window"""
+    actual_all = matrix.values[:, -holdout_buckets:]
+    first_bucket = matrix.start_bucket + matrix.values.shape[1] - holdout_buckets
+    timestamps = [EPOCH + timedelta(seconds=(first_bucket + i) * BUCKET_SECONDS) for i in range(holdout_buckets)]
+
+    results = {}
+    for row, lot_id in enumerate(matrix.lot_ids):
+        path = prophet_model_cache.model_path(int(lot_id))
+        if not os.path.exists(path):
+            continue
+
+        with open(path, 'rb') as f:
+            model = pickle.load(f)
+        predicted = model.predict(pd.DataFrame({'ds': timestamps}))['yhat'].to_numpy()
+        actual = actual_all[row]
+        observed = ~np.isnan(actual)
+        if not observed.any():
+            continue
+
+        err = predicted[observed] - actual[observed]
+        results[int(lot_id)] = {
+            "mae": float(np.abs(err).mean()),
+            "rmse": float(np.sqrt((err * err).mean()))
+        }
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare fleet and Prophet forecast accuracy")
+    parser.add_argument("--lookback-days", type=int, default=settings.FLEET_FORECAST_LOOKBACK_DAYS)
+    parser.add_argument("--holdout-hours", type=int, default=24)
+    args = parser.parse_args(argv)
+
+    holdout_buckets = args.holdout_hours * 3600 // BUCKET_SECONDS
+
+    print("=" * 60)
+    print("ParkPulse Forecaster Backtest")
+    print("=" * 60)
+
+    db = SessionLocal()
+    try:
+        matrix = OccupancyMatrix.from_db(db, args.lookback_days)
+    finally:
+        db.close()
+
+    print(f"Occupancy matrix: {matrix.values.shape[0]} lots x {matrix.values.shape[1]} buckets")
+
+    started = time.perf_counter()
+    fleet = backtest(matrix, holdout_buckets, min_buckets=settings.FLEET_FORECAST_MIN_BUCKETS)
+    print(f"Fleet forecaster fitted and scored in {time.perf_counter() - started:.2f}s")
+
+    started = time.perf_counter()
+    prophet = prophet_backtest(matrix, holdout_buckets)
+    print(f"Prophet models scored in {time.perf_counter() - started:.2f}s")
+
+    print("\n" + "=" * 60)
+    print(f"{'Lot':>8} {'Fleet MAE':>10} {'Fleet RMSE':>11} {'Prophet MAE':>12} {'Prophet RMSE':>13}")
+    for lot_id in sorted(set(fleet) | set(prophet)):
+        f = fleet.get(lot_id, {})
+        p = prophet.get(lot_id, {})
+        print(f"{lot_id:>8} {f.get('mae', float('nan')):>10.2f} {f.get('rmse', float('nan')):>11.2f} "
+              f"{p.get('mae', float('nan')):>12.2f} {p.get('rmse', float('nan')):>13.2f}")
+
+    both = sorted(set(fleet) & set(prophet))
+    if both:
+        print("\nLots scored by both models:", len(both))
+        print(f"  Fleet mean MAE:   {np.mean([fleet[i]['mae'] for i in both]):.2f}")
+        print(f"  Prophet mean MAE: {np.mean([prophet[i]['mae'] for i in both]):.2f}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -13,6 +13,7 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from core.database import Base, engine
 from core.config import settings
+from core.timescale import setup_occupancy_timescale
 from models.models import (
     User, ParkingLot, ParkingSlot, Booking, Payment, 
     OccupancyLog, PredictionLog, EdgeGateway, PricingRule,
@@ -28,6 +29,11 @@ def create_tables():
     print("Creating database tables...")
     Base.metadata.create_all(bind=engine)
     print("✓ Tables created successfully!")
+    
+    if settings.TIMESCALE_ENABLED:
+        print("Setting up TimescaleDB hypertable and occupancy rollups...")
+        setup_occupancy_timescale(engine)
+        print("✓ TimescaleDB ready!")
 
 
 def seed_data():
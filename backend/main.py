@@ -3,21 +3,34 @@ ParkPulse Backend - Main Application Entry Point
 FastAPI application with marketplace, real-time, and prediction services
 """
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
+import asyncio
 import logging
 import sys
 from pathlib import Path
+from typing import Optional, Tuple
 
 # Add the backend directory to Python path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from api.routes import auth, users, lots, bookings, payments, occupancy, predictions, owners, admin, locations, pricing
+from api.routes.auth import user_id_from_token
 from core.config import settings
 from core.database import engine, Base
 from core.websocket_manager import manager
+from core.redis_client import close_redis
+from services.forecast_model_cache import prophet_model_cache
+from services.forecast_service import run_forecast_refresh_loop, prediction_log_writer
+from services.forecast_evaluation import run_forecast_evaluation_loop
+from services.occupancy_ingest import occupancy_writer
+from services.latest_occupancy import latest_occupancy_cache
+from services.recent_occupancy import recent_occupancy
+from services.occupancy_push import occupancy_publisher
+from services.slot_grid import VEHICLE_TYPES, slot_grid
+from services.occupancy_retention import run_occupancy_retention_loop
 
 # Configure logging
 logging.basicConfig(
@@ -38,10 +51,39 @@ async def lifespan(app: FastAPI):
     # Initialize database tables
     # Base.metadata.create_all(bind=engine)  # Use Alembic in production
     
+    # Preload forecast models for the busiest lots
+    await prophet_model_cache.warmup(settings.FORECAST_WARMUP_LOT_IDS)
+    
+    # Latest reading and last day of readings per lot, served from memory
+    await latest_occupancy_cache.warm()
+    await recent_occupancy.warm()
+    
+    # Background tasks
+    occupancy_writer.start()
+    prediction_log_writer.start()
+    await manager.start()
+    occupancy_publisher.start()
+    background_tasks = [
+        asyncio.create_task(prophet_model_cache.watch(settings.FORECAST_MODEL_WATCH_SECONDS)),
+        asyncio.create_task(run_forecast_refresh_loop()),
+        asyncio.create_task(run_forecast_evaluation_loop()),
+        asyncio.create_task(run_occupancy_retention_loop()),
+    ]
+    
     yield
     
     # Shutdown
     logger.info("👋 Shutting down ParkPulse Backend...")
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await occupancy_publisher.stop()
+    await manager.stop()
+    
+    # Flush buffered writes
+    await occupancy_writer.stop()
+    await prediction_log_writer.stop()
+    await close_redis()
 
 
 # Initialize FastAPI app
@@ -86,32 +128,81 @@ async def root():
     }
 
 
+async def _websocket_user(websocket: WebSocket, token: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """Resolve the optional ``?token=`` of a WebSocket; rejects the handshake if it is invalid"""
+    if token is None:
+        return True, None
+    user_id = user_id_from_token(token)
+    if user_id is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return False, None
+    return True, str(user_id)
+
+
 # WebSocket endpoint for real-time occupancy
 @app.websocket("/ws/occupancy/{lot_id}")
-async def websocket_occupancy(websocket: WebSocket, lot_id: str):
-    """WebSocket endpoint for real-time occupancy updates"""
-    await manager.connect(websocket, lot_id)
+async def websocket_occupancy(websocket: WebSocket, lot_id: str, token: Optional[str] = None):
+    """WebSocket endpoint for real-time updates of one lot (all its topics; see ``/ws`` for many lots)"""
+    ok, user_id = await _websocket_user(websocket, token)
+    if not ok:
+        return
+    await manager.connect(websocket, lot_id, user_id=user_id)
     try:
         while True:
             # Keep connection alive and listen for client messages
             data = await websocket.receive_text()
             logger.info(f"Received message from client for lot {lot_id}: {data}")
     except WebSocketDisconnect:
-        manager.disconnect(websocket, lot_id)
         logger.info(f"Client disconnected from lot {lot_id}")
+    finally:
+        manager.disconnect(websocket)
+
+
+# WebSocket endpoint for the slot selection grid
+@app.websocket("/ws/slots/{lot_id}")
+async def websocket_slots(websocket: WebSocket, lot_id: int, vehicle_type: Optional[str] = None,
+                          since: Optional[int] = None, token: Optional[str] = None):
+    """Slot grid stream: a versioned snapshot (or the deltas after ``since``), then slot status deltas"""
+    ok, user_id = await _websocket_user(websocket, token)
+    if not ok:
+        return
+    if vehicle_type is not None and vehicle_type not in VEHICLE_TYPES:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await manager.connect(websocket, user_id=user_id, receive_global=False)
+    try:
+        await slot_grid.subscribe(websocket, lot_id, vehicle_type, since)
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        logger.info(f"Slot grid client disconnected from lot {lot_id}")
+    finally:
+        slot_grid.unsubscribe(websocket, lot_id, vehicle_type)
+        manager.disconnect(websocket)
 
 
 # Global WebSocket endpoint
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    """Global WebSocket endpoint for notifications"""
-    await websocket.accept()
+async def websocket_endpoint(websocket: WebSocket, token: Optional[str] = None):
+    """
+    Global WebSocket endpoint for notifications and multiplexed lot updates
+    
+    Pass ``?token=`` to receive your booking notifications, and send
+    subscribe/unsubscribe messages for any number of lot topics
+    (``occupancy:<lot>``, ``pricing:<lot>``, ``slots:<lot>``).
+    """
+    ok, user_id = await _websocket_user(websocket, token)
+    if not ok:
+        return
+    await manager.connect(websocket, user_id=user_id)
     try:
         while True:
             data = await websocket.receive_text()
-            await websocket.send_text(f"Message received: {data}")
+            await manager.send_personal_message(manager.handle_client_message(websocket, data), websocket)
     except WebSocketDisconnect:
         logger.info("WebSocket disconnected")
+    finally:
+        manager.disconnect(websocket)
 
 
 # Include API routers
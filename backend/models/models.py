@@ -2,7 +2,7 @@
 Database Models for ParkPulse
 """
 
-from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, ForeignKey, Enum, Text, JSON
+from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, ForeignKey, Enum, Text, JSON, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from core.database import Base
@@ -224,14 +224,18 @@ class Payment(Base):
 
 
 class OccupancyLog(Base):
-    """Time-series occupancy data"""
+    """Time-series occupancy data (a TimescaleDB hypertable partitioned on timestamp)"""
     __tablename__ = "occupancy_logs"
+    __table_args__ = (
+        Index("ix_occupancy_logs_lot_id_timestamp", "lot_id", "timestamp"),
+    )
     
+    # Hypertable unique keys must include the partitioning column
     id = Column(Integer, primary_key=True, autoincrement=True)
     lot_id = Column(Integer, ForeignKey("parking_lots.id"), nullable=False)
     
     # Occupancy data
-    timestamp = Column(DateTime(timezone=True), nullable=False, index=True)
+    timestamp = Column(DateTime(timezone=True), primary_key=True, nullable=False, index=True)
     occupied_count = Column(Integer, nullable=False)
     total_capacity = Column(Integer, nullable=False)
     
@@ -242,6 +246,18 @@ class OccupancyLog(Base):
     lot = relationship("ParkingLot", back_populates="occupancy_logs")
 
 
+class OccupancyLogArchive(Base):
+    """Raw occupancy readings moved out of occupancy_logs by the retention job"""
+    __tablename__ = "occupancy_logs_archive"
+    
+    id = Column(Integer, primary_key=True)
+    lot_id = Column(Integer, nullable=False)
+    timestamp = Column(DateTime(timezone=True), primary_key=True, index=True)
+    occupied_count = Column(Integer, nullable=False)
+    total_capacity = Column(Integer, nullable=False)
+    sensor_data = Column(JSON)
+
+
 class PredictionLog(Base):
     """ML prediction logs for monitoring"""
     __tablename__ = "prediction_logs"
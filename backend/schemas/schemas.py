@@ -7,6 +7,8 @@ from typing import Optional, List, Dict, Any
 from datetime import datetime
 from enum import Enum
 
+from core.config import settings
+
 
 # Enums
 class UserRole(str, Enum):
@@ -207,6 +209,40 @@ class DemandForecast(BaseModel):
     predictions: List[Dict[str, Any]]
 
 
+class DemandForecastBatchRequest(BaseModel):
+    lot_ids: List[int] = Field(..., min_length=1, max_length=500)
+    horizon_minutes: int = Field(default=60, ge=15, le=settings.FORECAST_MAX_HORIZON_MINUTES)
+
+
+class DemandForecastBatch(BaseModel):
+    horizon_minutes: int
+    forecasts: List[DemandForecast]
+    missing_lot_ids: List[int] = []
+
+
+class ForecastAccuracy(BaseModel):
+    lot_id: Optional[int] = None
+    model_version: Optional[str] = None
+    evaluated: int
+    mae: Optional[float] = None
+    rmse: Optional[float] = None
+
+
+class ForecastAccuracyReport(BaseModel):
+    since: datetime
+    by_model_version: List[ForecastAccuracy]
+    by_lot: List[ForecastAccuracy]
+
+
+class ForecastModelCacheMetrics(BaseModel):
+    models: int
+    bytes: int
+    max_bytes: int
+    hits: int
+    misses: int
+    evictions: int
+
+
 class PredictionRequest(BaseModel):
     lot_id: int
     from_time: datetime
@@ -328,3 +364,62 @@ class OccupancyCreate(BaseModel):
     total_capacity: int
     timestamp: Optional[datetime] = None
     sensor_data: Optional[Dict[str, Any]] = None
+    # Retries carry the same (gateway_id, sequence) and are dropped as duplicates
+    gateway_id: Optional[str] = Field(None, max_length=64)
+    sequence: Optional[int] = Field(None, ge=0)
+
+
+class OccupancyBatchCreate(BaseModel):
+    readings: List[OccupancyCreate] = Field(..., min_length=1)
+
+
+class OccupancyItemStatus(BaseModel):
+    index: int
+    status: str  # "queued", "duplicate" or "rejected"
+    error: Optional[str] = None
+
+
+class OccupancyBatchResult(BaseModel):
+    accepted: int
+    rejected: int
+    duplicates: int = 0
+    results: List[OccupancyItemStatus]
+
+
+class OccupancyFrameResult(BaseModel):
+    accepted: int
+    rejected: int
+    duplicates: int = 0
+    rejected_indices: List[int]  # Positions of readings for unknown lots
+
+
+class OccupancySeries(BaseModel):
+    lot_id: int
+    total_capacity: int
+    timestamps: List[int]  # Epoch seconds, oldest first
+    occupied_counts: List[int]
+
+
+class OccupancyIngestMetrics(BaseModel):
+    depth: int
+    max_pending: int
+    enqueued: int
+    written: int
+    dropped: int
+    rejected: int
+    retries: int
+    flushes: int
+    last_flush_ms: float
+    avg_flush_ms: float
+    duplicates: int
+
+
+class WebSocketMetrics(BaseModel):
+    connections: int
+    users: int
+    topics: int
+    pending: int
+    sent: int
+    coalesced: int
+    dropped: int
+    evicted: int
@@ -0,0 +1,254 @@
+"""
+Fleet Forecaster
+Vectorized seasonal Holt-Winters fitted for every lot at once over a
+(lot x 15-minute bucket) occupancy matrix
+"""
+
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import func
+
+from core.config import settings
+from models.models import OccupancyLog
+
+logger = logging.getLogger(__name__)
+
+BUCKET_SECONDS = 15 * 60
+HOURS_PER_WEEK = 168
+EPOCH = datetime(1970, 1, 1)
+
+# Width of the confidence band in residual standard deviations (~80% interval)
+BAND_Z = 1.28
+
+
+def to_bucket(ts: datetime) -> int:
+    """15-minute bucket index since the epoch for a naive UTC datetime"""
+    return int((ts - EPOCH).total_seconds() // BUCKET_SECONDS)
+
+
+def bucket_column():
+    """SQL expression for the 15-minute bucket index of an occupancy reading"""
+    return func.floor(func.extract('epoch', OccupancyLog.timestamp) / BUCKET_SECONDS)
+
+
+def hour_of_week(buckets: np.ndarray) -> np.ndarray:
+    """Hour of week (Monday 00:00 = 0) for an array of bucket indices"""
+    hours = buckets * BUCKET_SECONDS // 3600
+    # The epoch was a Thursday, 72 hours after the start of its week
+    return (hours + 72) % HOURS_PER_WEEK
+
+
+class OccupancyMatrix:
+    """Mean occupied count per lot per 15-minute bucket, NaN where no reading exists"""
+
+    def __init__(self, lot_ids: np.ndarray, start_bucket: int, values: np.ndarray):
+        self.lot_ids = lot_ids
+        self.start_bucket = start_bucket
+        self.values = values
+
+    @property
+    def buckets(self) -> np.ndarray:
+        return np.arange(self.start_bucket, self.start_bucket + self.values.shape[1])
+
+    @classmethod
+    def from_db(cls, db, lookback_days: int, now: Optional[datetime] = None) -> "OccupancyMatrix":
+        """Build the matrix from one grouped query over the lookback window"""
+        now = now or datetime.utcnow()
+        since = now - timedelta(days=lookback_days)
+        bucket = bucket_column()
+
+        rows = db.query(
+            OccupancyLog.lot_id,
+            bucket,
+            func.avg(OccupancyLog.occupied_count)
+        ).filter(
+            OccupancyLog.timestamp >= since
+        ).group_by(OccupancyLog.lot_id, bucket).all()
+
+        start_bucket = to_bucket(since)
+        n_buckets = to_bucket(now) - start_bucket + 1
+
+        if not rows:
+            return cls(np.array([], dtype=np.int64), start_bucket, np.empty((0, n_buckets)))
+
+        data = np.array(rows, dtype=np.float64)
+        return cls.from_readings(
+            data[:, 0].astype(np.int64),
+            data[:, 1].astype(np.int64),
+            data[:, 2],
+            start_bucket,
+            n_buckets
+        )
+
+    @classmethod
+    def from_readings(cls, lot_ids: np.ndarray, buckets: np.ndarray, counts: np.ndarray,
+                      start_bucket: int, n_buckets: int) -> "OccupancyMatrix":
+        """Scatter (lot, bucket, count) triples into a dense matrix"""
+        unique_lots, rows = np.unique(lot_ids, return_inverse=True)
+        cols = buckets - start_bucket
+        keep = (cols >= 0) & (cols < n_buckets)
+
+        values = np.full((len(unique_lots), n_buckets), np.nan)
+        values[rows[keep], cols[keep]] = counts[keep]
+        return cls(unique_lots, start_bucket, values)
+
+
+class FleetForecaster:
+    """
+    Additive Holt-Winters with a damped trend and hour-of-week seasonality
+
+    Seasonal components are initialised from the seasonal-naive hour-of-week
+    profile of each lot, then every lot is smoothed in lockstep: the loop runs
+    over time buckets while each step is a NumPy operation across all lots.
+    Missing buckets carry the state forward without an update.
+    """
+
+    def __init__(self, alpha: float = 0.3, beta: float = 0.05, gamma: float = 0.1,
+                 phi: float = 0.9, min_buckets: int = 96):
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.phi = phi
+        self.min_buckets = min_buckets
+
+        self.lot_ids = np.array([], dtype=np.int64)
+        self.last_bucket: Optional[int] = None
+        self.level = np.empty(0)
+        self.trend = np.empty(0)
+        self.season = np.empty((0, HOURS_PER_WEEK))
+        self.sigma = np.empty(0)
+        self._index: Dict[int, int] = {}
+
+    def fit(self, matrix: OccupancyMatrix) -> "FleetForecaster":
+        values = matrix.values
+        observed = ~np.isnan(values)
+
+        # Only lots with enough history get a model
+        enough = observed.sum(axis=1) >= self.min_buckets
+        values = values[enough]
+        observed = observed[enough]
+        self.lot_ids = matrix.lot_ids[enough]
+        self._index = {int(lot_id): i for i, lot_id in enumerate(self.lot_ids)}
+        self.last_bucket = matrix.start_bucket + matrix.values.shape[1] - 1
+
+        n_lots = len(self.lot_ids)
+        if n_lots == 0:
+            self.level = self.trend = self.sigma = np.empty(0)
+            self.season = np.empty((0, HOURS_PER_WEEK))
+            return self
+
+        how = hour_of_week(matrix.buckets)
+        onehot = np.zeros((len(how), HOURS_PER_WEEK))
+        onehot[np.arange(len(how)), how] = 1.0
+
+        # Seasonal-naive hour-of-week profile per lot
+        filled = np.where(observed, values, 0.0)
+        sums = filled @ onehot
+        counts = observed.astype(np.float64) @ onehot
+        lot_mean = filled.sum(axis=1) / observed.sum(axis=1)
+        profile = np.where(counts > 0, sums / np.maximum(counts, 1), lot_mean[:, None])
+
+        season = profile - lot_mean[:, None]
+        level = lot_mean.copy()
+        trend = np.zeros(n_lots)
+        sq_err = np.zeros(n_lots)
+        n_err = np.zeros(n_lots)
+        rows = np.arange(n_lots)
+
+        for t in range(values.shape[1]):
+            y = values[:, t]
+            ok = observed[:, t]
+            s = season[rows, how[t]]
+            damped = self.phi * trend
+            expected = level + damped + s
+
+            err = np.where(ok, y - expected, 0.0)
+            sq_err += err * err
+            n_err += ok
+
+            new_level = np.where(ok, self.alpha * (y - s) + (1 - self.alpha) * (level + damped), level + damped)
+            trend = np.where(ok, self.beta * (new_level - level) + (1 - self.beta) * damped, damped)
+            season[rows, how[t]] = np.where(ok, self.gamma * (y - new_level) + (1 - self.gamma) * s, s)
+            level = new_level
+
+        self.level = level
+        self.trend = trend
+        self.season = season
+        self.sigma = np.sqrt(sq_err / np.maximum(n_err, 1))
+        return self
+
+    def has_lot(self, lot_id: int) -> bool:
+        return lot_id in self._index
+
+    def predict(self, start: datetime, steps: int, lot_ids: Optional[List[int]] = None) -> np.ndarray:
+        """
+        Forecast ``steps`` 15-minute steps from ``start``
+
+        Returns an array of shape (lots, 3, steps) with predicted occupancy,
+        lower and upper bounds, for ``lot_ids`` (default: every fitted lot).
+        """
+        if lot_ids is None:
+            rows = np.arange(len(self.lot_ids))
+        else:
+            rows = np.array([self._index[lot_id] for lot_id in lot_ids], dtype=np.int64)
+
+        future = to_bucket(start) + np.arange(steps)
+        horizons = np.maximum(future - self.last_bucket, 1)
+        # Cumulative damping: phi + phi^2 + ... + phi^h
+        if self.phi == 1:
+            damping = horizons.astype(np.float64)
+        else:
+            damping = self.phi * (1 - self.phi ** horizons) / (1 - self.phi)
+
+        how = hour_of_week(future)
+        mean = (
+            self.level[rows, None]
+            + self.trend[rows, None] * damping[None, :]
+            + self.season[rows][:, how]
+        )
+        spread = BAND_Z * self.sigma[rows, None] * np.sqrt(horizons)[None, :]
+
+        result = np.empty((len(rows), 3, steps))
+        result[:, 0] = mean
+        result[:, 1] = mean - spread
+        result[:, 2] = mean + spread
+        return np.maximum(result, 0)
+
+
+def backtest(matrix: OccupancyMatrix, holdout_buckets: int, **params) -> Dict[int, Dict[str, float]]:
+    """
+    Fit on all but the last ``holdout_buckets`` buckets and score the rest
+
+    Returns MAE and RMSE per lot, computed over observed holdout buckets.
+    """
+    train = OccupancyMatrix(matrix.lot_ids, matrix.start_bucket, matrix.values[:, :-holdout_buckets])
+    actual_all = matrix.values[:, -holdout_buckets:]
+    forecaster = FleetForecaster(**params).fit(train)
+    if len(forecaster.lot_ids) == 0:
+        return {}
+
+    start = EPOCH + timedelta(seconds=(forecaster.last_bucket + 1) * BUCKET_SECONDS)
+    predicted = forecaster.predict(start, holdout_buckets)[:, 0]
+    actual = actual_all[np.isin(matrix.lot_ids, forecaster.lot_ids)]
+
+    observed = ~np.isnan(actual)
+    err = np.where(observed, predicted - actual, 0.0)
+    n = np.maximum(observed.sum(axis=1), 1)
+    mae = np.abs(err).sum(axis=1) / n
+    rmse = np.sqrt((err * err).sum(axis=1) / n)
+
+    return {
+        int(lot_id): {"mae": float(mae[i]), "rmse": float(rmse[i])}
+        for i, lot_id in enumerate(forecaster.lot_ids)
+    }
+
+
+def fit_fleet(db, now: Optional[datetime] = None) -> FleetForecaster:
+    """Build the occupancy matrix from the database and fit the whole fleet"""
+    matrix = OccupancyMatrix.from_db(db, settings.FLEET_FORECAST_LOOKBACK_DAYS, now)
+    forecaster = FleetForecaster(min_buckets=settings.FLEET_FORECAST_MIN_BUCKETS).fit(matrix)
+    logger.info(f"Fitted fleet forecaster for {len(forecaster.lot_ids)} lots")
+    return forecaster
@@ -0,0 +1,147 @@
+"""
+Forecast Evaluation Service
+Scores due PredictionLog rows against observed occupancy in bulk
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, literal_column, update
+
+from core.config import settings
+from core.database import SessionLocal
+from models.models import OccupancyLog, PredictionLog
+from services.fleet_forecaster import BUCKET_SECONDS, bucket_column
+
+logger = logging.getLogger(__name__)
+
+
+def evaluate_due_predictions(db, now: Optional[datetime] = None, batch_size: int = 5000,
+                             after_id: int = 0) -> Tuple[int, Optional[int]]:
+    """
+    Fill ``actuals``, ``mae`` and ``rmse`` for predictions whose horizon has passed
+
+    Every predicted step is matched to the mean observed occupancy of its
+    15-minute bucket. A log is due once the bucket of its last step has
+    closed and ingest has had FORECAST_EVALUATION_LAG_SECONDS to flush it.
+    Logs with no readings for any step are left unscored and retried on
+    later runs, until FORECAST_EVALUATION_MAX_AGE_HOURS after their horizon.
+    Matching and error metrics are computed with NumPy over all logs in the
+    batch, and results are written with one executemany UPDATE.
+    Returns the number of logs evaluated and the last id examined (None when
+    no log after ``after_id`` is due).
+    """
+    now = now or datetime.utcnow()
+    due = now - timedelta(seconds=BUCKET_SECONDS + settings.FORECAST_EVALUATION_LAG_SECONDS)
+    give_up = now - timedelta(hours=settings.FORECAST_EVALUATION_MAX_AGE_HOURS)
+    horizon_end = PredictionLog.generated_at + PredictionLog.horizon_minutes * literal_column("interval '1 minute'")
+
+    logs = db.query(
+        PredictionLog.id,
+        PredictionLog.lot_id,
+        PredictionLog.predictions,
+        (horizon_end <= give_up).label("expired")
+    ).filter(
+        PredictionLog.actuals.is_(None),
+        horizon_end <= due,
+        PredictionLog.id > after_id
+    ).order_by(PredictionLog.id).limit(batch_size).all()
+
+    if not logs:
+        return 0, None
+
+    # Flatten every predicted step of every log into parallel arrays
+    steps = [log.predictions or [] for log in logs]
+    lengths = np.array([len(s) for s in steps])
+    log_rows = np.repeat(np.arange(len(logs)), lengths)
+    lot_ids = np.repeat(np.array([log.lot_id for log in logs], dtype=np.int64), lengths)
+    flat = [step for s in steps for step in s]
+    predicted = np.array([step["predicted_occupancy"] for step in flat], dtype=np.float64)
+    timestamps = np.array([step["timestamp"] for step in flat], dtype="datetime64[s]")
+    buckets = timestamps.astype(np.int64) // BUCKET_SECONDS
+
+    # Observed mean occupancy for every (lot, bucket) in range, in one grouped query
+    actual = np.full(len(flat), np.nan)
+    if len(flat):
+        since = timestamps.min().astype(datetime)
+        until = timestamps.max().astype(datetime) + timedelta(seconds=BUCKET_SECONDS)
+        bucket = bucket_column()
+        rows = db.query(
+            OccupancyLog.lot_id,
+            bucket,
+            func.avg(OccupancyLog.occupied_count)
+        ).filter(
+            OccupancyLog.lot_id.in_(np.unique(lot_ids).tolist()),
+            OccupancyLog.timestamp >= since,
+            OccupancyLog.timestamp < until
+        ).group_by(OccupancyLog.lot_id, bucket).all()
+
+        if rows:
+            observed = np.array(rows, dtype=np.float64)
+            # Join on a combined (lot, bucket) key via a sorted search
+            offset = int(buckets.min())
+            span = int(max(buckets.max(), observed[:, 1].max())) - offset + 1
+            observed_keys = observed[:, 0].astype(np.int64) * span + (observed[:, 1].astype(np.int64) - offset)
+            order = np.argsort(observed_keys)
+            observed_keys = observed_keys[order]
+            observed_values = observed[order, 2]
+
+            keys = lot_ids * span + (buckets - offset)
+            pos = np.clip(np.searchsorted(observed_keys, keys), 0, len(observed_keys) - 1)
+            matched = observed_keys[pos] == keys
+            actual[matched] = observed_values[pos[matched]]
+
+    matched = ~np.isnan(actual)
+    err = np.where(matched, predicted - actual, 0.0)
+    counts = np.bincount(log_rows, weights=matched, minlength=len(logs))
+    abs_sum = np.bincount(log_rows, weights=np.abs(err), minlength=len(logs))
+    sq_sum = np.bincount(log_rows, weights=err * err, minlength=len(logs))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mae = np.where(counts > 0, abs_sum / counts, np.nan)
+        rmse = np.where(counts > 0, np.sqrt(sq_sum / counts), np.nan)
+
+    actual_lists = np.split(np.round(actual, 2), np.cumsum(lengths)[:-1])
+    rows = [
+        {
+            "id": log.id,
+            # Steps without sensor data are stored as null
+            "actuals": [None if np.isnan(v) else float(v) for v in values],
+            "mae": None if np.isnan(mae[i]) else float(mae[i]),
+            "rmse": None if np.isnan(rmse[i]) else float(rmse[i])
+        }
+        for i, (log, values) in enumerate(zip(logs, actual_lists))
+        # Keep actuals NULL so the log is retried while readings may still arrive
+        if counts[i] > 0 or log.expired
+    ]
+    if rows:
+        db.execute(update(PredictionLog), rows)
+        db.commit()
+    return len(rows), logs[-1].id
+
+
+def _evaluate_all() -> int:
+    db = SessionLocal()
+    try:
+        total, after_id = 0, 0
+        while after_id is not None:
+            evaluated, after_id = evaluate_due_predictions(db, after_id=after_id)
+            total += evaluated
+        return total
+    finally:
+        db.close()
+
+
+async def run_forecast_evaluation_loop():
+    """Background task that scores due predictions every FORECAST_EVALUATION_MINUTES"""
+    while True:
+        await asyncio.sleep(settings.FORECAST_EVALUATION_MINUTES * 60)
+        try:
+            evaluated = await asyncio.to_thread(_evaluate_all)
+            if evaluated:
+                logger.info(f"Evaluated {evaluated} prediction logs")
+        except Exception as e:
+            logger.error(f"Forecast evaluation failed: {e}", exc_info=True)
@@ -0,0 +1,168 @@
+"""
+Prophet Model Cache
+Keeps unpickled per-lot Prophet models in memory so forecasts don't hit disk
+"""
+
+import asyncio
+import logging
+import os
+import pickle
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedModel:
+    model: Any
+    mtime_ns: int
+    size_bytes: int
+
+
+class ProphetModelCache:
+    """
+    Bounded LRU cache of Prophet models keyed by lot and file mtime
+    
+    The memory budget is accounted using the pickle size on disk as a proxy
+    for the in-memory footprint. Unpickling runs in a worker thread so the
+    event loop is never blocked, and concurrent misses for the same lot share
+    a single load.
+    """
+    
+    def __init__(self, model_dir: str, max_bytes: int):
+        self.model_dir = model_dir
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[int, CachedModel]" = OrderedDict()
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._current_bytes = 0
+        
+        # Counters for monitoring
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def model_path(self, lot_id: int) -> str:
+        return os.path.join(self.model_dir, f"prophet_lot_{lot_id}.pkl")
+    
+    async def get(self, lot_id: int) -> Optional[Any]:
+        """Return the model for a lot, loading or reloading it if needed"""
+        try:
+            stat = os.stat(self.model_path(lot_id))
+        except FileNotFoundError:
+            self._discard(lot_id)
+            return None
+        
+        entry = self._lookup(lot_id, stat.st_mtime_ns)
+        if entry is not None:
+            self.hits += 1
+            return entry.model
+        
+        lock = self._locks.setdefault(lot_id, asyncio.Lock())
+        async with lock:
+            # Another request may have loaded it while we waited
+            entry = self._lookup(lot_id, stat.st_mtime_ns)
+            if entry is not None:
+                self.hits += 1
+                return entry.model
+            
+            self.misses += 1
+            return await self._load(lot_id)
+    
+    async def warmup(self, lot_ids: Iterable[int]):
+        """Preload models for the given lots (e.g. the busiest ones) at startup"""
+        loaded = 0
+        for lot_id in lot_ids:
+            try:
+                if await self.get(lot_id) is not None:
+                    loaded += 1
+            except Exception as e:
+                logger.error(f"Failed to warm up forecast model for lot {lot_id}: {e}")
+        logger.info(f"Warmed up {loaded} forecast models ({self._current_bytes / 1024 / 1024:.1f} MB)")
+    
+    async def refresh_changed(self):
+        """Reload cached models whose file changed on disk and drop deleted ones"""
+        for lot_id, entry in list(self._entries.items()):
+            try:
+                mtime_ns = os.stat(self.model_path(lot_id)).st_mtime_ns
+            except FileNotFoundError:
+                self._discard(lot_id)
+                continue
+            
+            if mtime_ns != entry.mtime_ns:
+                logger.info(f"Forecast model for lot {lot_id} changed on disk, reloading")
+                try:
+                    await self.get(lot_id)
+                except Exception as e:
+                    logger.error(f"Failed to reload forecast model for lot {lot_id}: {e}")
+    
+    async def watch(self, interval_seconds: float):
+        """Background task that keeps cached models in sync with the files on disk"""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            await self.refresh_changed()
+    
+    def stats(self) -> dict:
+        return {
+            "models": len(self._entries),
+            "bytes": self._current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+    
+    def _lookup(self, lot_id: int, mtime_ns: int) -> Optional[CachedModel]:
+        entry = self._entries.get(lot_id)
+        if entry is None or entry.mtime_ns != mtime_ns:
+            return None
+        self._entries.move_to_end(lot_id)
+        return entry
+    
+    async def _load(self, lot_id: int) -> Optional[Any]:
+        path = self.model_path(lot_id)
+        try:
+            model, mtime_ns, size_bytes = await asyncio.to_thread(self._read_model, path)
+        except FileNotFoundError:
+            self._discard(lot_id)
+            return None
+        
+        self._discard(lot_id)
+        if size_bytes <= self.max_bytes:
+            self._entries[lot_id] = CachedModel(model=model, mtime_ns=mtime_ns, size_bytes=size_bytes)
+            self._current_bytes += size_bytes
+            self._evict_to_budget()
+        else:
+            logger.warning(f"Forecast model for lot {lot_id} exceeds cache budget, not caching")
+        
+        return model
+    
+    @staticmethod
+    def _read_model(path: str):
+        # Stat the open file so the recorded mtime matches the bytes we read
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            model = pickle.load(f)
+        return model, stat.st_mtime_ns, stat.st_size
+    
+    def _discard(self, lot_id: int):
+        entry = self._entries.pop(lot_id, None)
+        if entry is not None:
+            self._current_bytes -= entry.size_bytes
+    
+    def _evict_to_budget(self):
+        while self._current_bytes > self.max_bytes and self._entries:
+            lot_id, entry = self._entries.popitem(last=False)
+            self._current_bytes -= entry.size_bytes
+            self.evictions += 1
+            logger.info(f"Evicted forecast model for lot {lot_id} from cache")
+
+
+# Singleton instance
+prophet_model_cache = ProphetModelCache(
+    model_dir=settings.ML_MODEL_PATH,
+    max_bytes=settings.FORECAST_MODEL_CACHE_MB * 1024 * 1024
+)
@@ -0,0 +1,399 @@
+"""
+Demand Forecast Service
+Precomputes lot forecasts on a schedule and serves them from an in-memory store
+"""
+
+import asyncio
+import logging
+import math
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func
+
+from core.config import settings
+from core.database import SessionLocal
+from core.write_behind import WriteBehindQueue
+from models.models import ParkingLot, OccupancyLog, PredictionLog
+from services.fleet_forecaster import FleetForecaster, fit_fleet
+from services.forecast_model_cache import prophet_model_cache
+from services.global_demand_model import GlobalDemandModel, model_path as global_model_path
+from services.recent_occupancy import recent_occupancy
+
+logger = logging.getLogger(__name__)
+
+FORECAST_STEP_MINUTES = 15
+
+
+@dataclass
+class LotForecast:
+    """Full-horizon forecast for one lot stored as a (3, steps) float32 array"""
+    lot_id: int
+    generated_at: datetime
+    model_version: str
+    total_slots: int
+    # Rows: predicted occupancy, confidence lower, confidence upper
+    values: np.ndarray
+
+    @property
+    def steps(self) -> int:
+        return self.values.shape[1]
+
+    def timestamp(self, step: int) -> datetime:
+        return self.generated_at + timedelta(minutes=step * FORECAST_STEP_MINUTES)
+
+    def slice(self, horizon_minutes: int, now: Optional[datetime] = None) -> Optional[List[dict]]:
+        """
+        Return the predictions covering ``horizon_minutes`` from ``now``
+
+        The stored series starts at ``generated_at``, so requests made later
+        skip the steps that are already in the past. Returns None when the
+        stored forecast no longer covers the requested window.
+        """
+        now = now or datetime.utcnow()
+        elapsed = (now - self.generated_at).total_seconds() / 60
+        offset = max(0, math.ceil(elapsed / FORECAST_STEP_MINUTES))
+        count = horizon_minutes // FORECAST_STEP_MINUTES
+
+        if offset + count > self.steps:
+            return None
+
+        window = self.values[:, offset:offset + count].astype(int)
+        return [
+            {
+                "timestamp": self.timestamp(offset + i).isoformat(),
+                "predicted_occupancy": int(window[0, i]),
+                "confidence_lower": int(window[1, i]),
+                "confidence_upper": int(window[2, i])
+            }
+            for i in range(count)
+        ]
+
+
+class ForecastStore:
+    """In-memory per-lot forecast store filled by the refresh job"""
+
+    def __init__(self):
+        self._forecasts: Dict[int, LotForecast] = {}
+        self.last_refresh: Optional[datetime] = None
+        # Global model artifact, used for every lot when present
+        self.global_model: Optional[GlobalDemandModel] = None
+        self.global_model_mtime_ns: Optional[int] = None
+        # Fleet model from the last refresh, used for lots without a Prophet model
+        self.fleet: Optional[FleetForecaster] = None
+
+    def get(self, lot_id: int) -> Optional[LotForecast]:
+        return self._forecasts.get(lot_id)
+
+    def put(self, forecast: LotForecast):
+        self._forecasts[forecast.lot_id] = forecast
+
+    def replace_all(self, forecasts: List[LotForecast]):
+        self._forecasts = {forecast.lot_id: forecast for forecast in forecasts}
+        self.last_refresh = datetime.utcnow()
+
+    def __len__(self) -> int:
+        return len(self._forecasts)
+
+
+def store_steps() -> int:
+    """Number of steps to precompute so every refresh interval still covers the max horizon"""
+    minutes = settings.FORECAST_MAX_HORIZON_MINUTES + settings.FORECAST_REFRESH_MINUTES
+    return math.ceil(minutes / FORECAST_STEP_MINUTES)
+
+
+def recent_average_occupancy(db, lot_ids: List[int]) -> Dict[int, float]:
+    """Average occupied count over the last hour for each lot, from the in-memory ring buffers"""
+    averages = recent_occupancy.mean(lot_ids, 60)
+    # Lots this process has no buffer for (e.g. the buffers were never warmed) fall back to SQL
+    missing = [lot_id for lot_id in lot_ids if not recent_occupancy.has_lot(lot_id)]
+    if not missing:
+        return averages
+
+    hour_ago = datetime.utcnow() - timedelta(hours=1)
+    rows = db.query(
+        OccupancyLog.lot_id,
+        func.avg(OccupancyLog.occupied_count)
+    ).filter(
+        OccupancyLog.lot_id.in_(missing),
+        OccupancyLog.timestamp >= hour_ago
+    ).group_by(OccupancyLog.lot_id).all()
+
+    averages.update({lot_id: float(avg) for lot_id, avg in rows})
+    return averages
+
+
+def occupancy_profiles(db, lot_ids: List[int], lookback_days: int) -> Dict[int, np.ndarray]:
+    """
+    Hour-of-day occupancy profile per lot from SQL aggregates
+
+    Returns a (3, 24) array per lot with the mean and the 10th/90th
+    percentile of occupied count for each UTC hour. Hours without data take
+    the lot's mean over the hours that have it.
+    """
+    since = datetime.utcnow() - timedelta(days=lookback_days)
+    hour = func.extract('hour', func.timezone('UTC', OccupancyLog.timestamp))
+    occupied = OccupancyLog.occupied_count
+
+    rows = db.query(
+        OccupancyLog.lot_id,
+        hour,
+        func.avg(occupied),
+        func.percentile_cont(0.1).within_group(occupied),
+        func.percentile_cont(0.9).within_group(occupied)
+    ).filter(
+        OccupancyLog.lot_id.in_(lot_ids),
+        OccupancyLog.timestamp >= since
+    ).group_by(OccupancyLog.lot_id, hour).all()
+
+    if not rows:
+        return {}
+
+    data = np.array(rows, dtype=np.float64)
+    unique_lots, lot_rows = np.unique(data[:, 0].astype(np.int64), return_inverse=True)
+    profiles = np.full((len(unique_lots), 3, 24), np.nan)
+    profiles[lot_rows, :, data[:, 1].astype(np.int64)] = data[:, 2:]
+
+    fill = np.nanmean(profiles, axis=2, keepdims=True)
+    profiles = np.where(np.isnan(profiles), fill, profiles)
+    return {int(lot_id): profiles[i] for i, lot_id in enumerate(unique_lots)}
+
+
+def _load_profiles(lot_ids: List[int]) -> Dict[int, np.ndarray]:
+    db = SessionLocal()
+    try:
+        return occupancy_profiles(db, lot_ids, settings.FORECAST_FALLBACK_LOOKBACK_DAYS)
+    finally:
+        db.close()
+
+
+def fallback_forecast(lot_id: int, total_slots: int, profile: Optional[np.ndarray],
+                      generated_at: datetime, steps: int) -> LotForecast:
+    """Forecast from the lot's hour-of-day profile (or a flat 50% when there is no data)"""
+    if profile is None:
+        occupancy = total_slots * 0.5  # Default to 50%
+        values = np.empty((3, steps), dtype=np.float32)
+        values[0] = int(occupancy)
+        values[1] = max(0, int(occupancy * 0.8))
+        values[2] = min(total_slots, int(occupancy * 1.2))
+        model_version = "simple_average"
+    else:
+        hours = [(generated_at + timedelta(minutes=i * FORECAST_STEP_MINUTES)).hour for i in range(steps)]
+        values = profile[:, hours].astype(np.float32)
+        np.clip(values, 0, total_slots, out=values)
+        model_version = "hourly_profile"
+
+    return LotForecast(
+        lot_id=lot_id,
+        generated_at=generated_at,
+        model_version=model_version,
+        total_slots=total_slots,
+        values=values
+    )
+
+
+async def prophet_forecast(model, lot_id: int, total_slots: int,
+                           generated_at: datetime, steps: int) -> LotForecast:
+    """Run a Prophet model over the full horizon in a worker thread"""
+    future_df = pd.DataFrame({
+        'ds': [generated_at + timedelta(minutes=i * FORECAST_STEP_MINUTES) for i in range(steps)]
+    })
+    forecast = await asyncio.to_thread(model.predict, future_df)
+
+    values = np.vstack([
+        forecast['yhat'].to_numpy(),
+        forecast['yhat_lower'].to_numpy(),
+        forecast['yhat_upper'].to_numpy()
+    ]).astype(np.float32)
+    np.clip(values, 0, total_slots, out=values)
+
+    return LotForecast(
+        lot_id=lot_id,
+        generated_at=generated_at,
+        model_version="prophet_v1",
+        total_slots=total_slots,
+        values=values
+    )
+
+
+def fleet_forecasts(fleet: FleetForecaster, lots: List[ParkingLot],
+                    generated_at: datetime, steps: int) -> Dict[int, LotForecast]:
+    """Forecast every fitted lot in one vectorized call"""
+    lots = [lot for lot in lots if fleet.has_lot(lot.id)]
+    if not lots:
+        return {}
+
+    values = fleet.predict(generated_at, steps, [lot.id for lot in lots]).astype(np.float32)
+    capacities = np.array([lot.total_slots for lot in lots], dtype=np.float32)
+    np.minimum(values, capacities[:, None, None], out=values)
+
+    return {
+        lot.id: LotForecast(
+            lot_id=lot.id,
+            generated_at=generated_at,
+            model_version="fleet_hw_v1",
+            total_slots=lot.total_slots,
+            values=values[i]
+        )
+        for i, lot in enumerate(lots)
+    }
+
+
+def global_forecasts(model: GlobalDemandModel, lots: List[ParkingLot], averages: Dict[int, float],
+                     generated_at: datetime, steps: int) -> List[LotForecast]:
+    """Forecast the whole fleet, cold-start lots included, in one batched call"""
+    if not lots:
+        return []
+
+    values = model.predict(lots, averages, generated_at, steps).astype(np.float32)
+    return [
+        LotForecast(
+            lot_id=lot.id,
+            generated_at=generated_at,
+            model_version=model.version,
+            total_slots=lot.total_slots,
+            values=values[i]
+        )
+        for i, lot in enumerate(lots)
+    ]
+
+
+def load_global_model():
+    """(Re)load the global model artifact if it appeared or changed on disk"""
+    path = global_model_path()
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        forecast_store.global_model = None
+        forecast_store.global_model_mtime_ns = None
+        return
+
+    if mtime_ns != forecast_store.global_model_mtime_ns:
+        forecast_store.global_model = GlobalDemandModel.load(path)
+        forecast_store.global_model_mtime_ns = mtime_ns
+        logger.info(f"Loaded global demand model from {path}")
+
+
+async def compute_forecasts(lots: List[ParkingLot], averages: Dict[int, float],
+                            generated_at: datetime) -> List[LotForecast]:
+    """
+    Compute full-horizon forecasts for the given lots
+
+    When the global model is available it forecasts every lot in one call.
+    Otherwise lots with a Prophet model use it; the rest use the fleet
+    forecaster when it has enough history for them, and an hour-of-day
+    profile from SQL aggregates otherwise.
+    """
+    steps = store_steps()
+    if forecast_store.global_model:
+        return await asyncio.to_thread(
+            global_forecasts, forecast_store.global_model, lots, averages, generated_at, steps
+        )
+
+    fleet = fleet_forecasts(forecast_store.fleet, lots, generated_at, steps) if forecast_store.fleet else {}
+    forecasts = []
+
+    fallback_lots = []
+
+    for lot in lots:
+        model = await prophet_model_cache.get(lot.id)
+        if model is not None:
+            forecasts.append(await prophet_forecast(model, lot.id, lot.total_slots, generated_at, steps))
+        elif lot.id in fleet:
+            forecasts.append(fleet[lot.id])
+        else:
+            fallback_lots.append(lot)
+
+    if fallback_lots:
+        profiles = await asyncio.to_thread(_load_profiles, [lot.id for lot in fallback_lots])
+        forecasts.extend(
+            fallback_forecast(lot.id, lot.total_slots, profiles.get(lot.id), generated_at, steps)
+            for lot in fallback_lots
+        )
+
+    return forecasts
+
+
+async def forecast_lots(db, lots: List[ParkingLot]) -> List[LotForecast]:
+    """Compute and store forecasts for lots missing from the store, in bulk"""
+    if not lots:
+        return []
+
+    averages = await asyncio.to_thread(recent_average_occupancy, db, [lot.id for lot in lots])
+    forecasts = await compute_forecasts(lots, averages, datetime.utcnow())
+    for forecast in forecasts:
+        forecast_store.put(forecast)
+    return forecasts
+
+
+async def forecast_lot(db, lot: ParkingLot) -> LotForecast:
+    """Compute and store the forecast for a single lot (used on store misses)"""
+    forecasts = await forecast_lots(db, [lot])
+    return forecasts[0]
+
+
+def _load_active_lots():
+    db = SessionLocal()
+    try:
+        lots = db.query(ParkingLot).filter(ParkingLot.is_active == True).all()
+        db.expunge_all()
+        averages = recent_average_occupancy(db, [lot.id for lot in lots]) if lots else {}
+        fleet = fit_fleet(db)
+        load_global_model()
+        return lots, averages, fleet
+    finally:
+        db.close()
+
+
+def prediction_log_row(forecast: LotForecast, horizon_minutes: int, predictions: List[dict]) -> dict:
+    return {
+        "lot_id": forecast.lot_id,
+        "generated_at": forecast.generated_at,
+        "horizon_minutes": horizon_minutes,
+        "model_version": forecast.model_version,
+        "predictions": predictions
+    }
+
+
+async def refresh_forecasts():
+    """Forecast every active lot over the full horizon and swap them into the store"""
+    started = datetime.utcnow()
+    lots, averages, forecast_store.fleet = await asyncio.to_thread(_load_active_lots)
+    forecasts = await compute_forecasts(lots, averages, started)
+    forecast_store.replace_all(forecasts)
+
+    # Keep a monitoring record of each scheduled forecast
+    horizon_minutes = store_steps() * FORECAST_STEP_MINUTES
+    prediction_log_writer.offer_many(
+        prediction_log_row(forecast, horizon_minutes, forecast.slice(horizon_minutes, forecast.generated_at))
+        for forecast in forecasts
+    )
+
+    elapsed = (datetime.utcnow() - started).total_seconds()
+    logger.info(f"Refreshed forecasts for {len(forecasts)} lots in {elapsed:.2f}s")
+
+
+async def run_forecast_refresh_loop():
+    """Background task that refreshes the forecast store every FORECAST_REFRESH_MINUTES"""
+    while True:
+        try:
+            await refresh_forecasts()
+        except Exception as e:
+            logger.error(f"Forecast refresh failed: {e}", exc_info=True)
+        await asyncio.sleep(settings.FORECAST_REFRESH_MINUTES * 60)
+
+
+# Singleton instances
+forecast_store = ForecastStore()
+
+prediction_log_writer = WriteBehindQueue(
+    name="prediction_logs",
+    model=PredictionLog,
+    max_batch=settings.PREDICTION_LOG_BATCH_SIZE,
+    flush_interval=settings.PREDICTION_LOG_FLUSH_SECONDS,
+    max_pending=settings.PREDICTION_LOG_MAX_PENDING
+)
@@ -0,0 +1,222 @@
+"""
+Global Demand Model
+One gradient-boosted model trained across every lot, replacing per-lot Prophet pickles
+"""
+
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import joblib
+import numpy as np
+from sklearn.ensemble import HistGradientBoostingRegressor
+
+from core.config import settings
+from models.models import LotType
+from services.fleet_forecaster import HOURS_PER_WEEK, OccupancyMatrix, hour_of_week, to_bucket
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILENAME = "demand_global.pkl"
+
+# Buckets averaged for the "recent occupancy" feature (one hour of 15-minute buckets)
+RECENT_BUCKETS = 4
+
+# Share of training rows with the recent-occupancy feature hidden, so the
+# model learns to forecast lots that have no history (cold start)
+COLD_START_FRACTION = 0.2
+
+MAX_CITIES = 250
+
+
+def model_path() -> str:
+    return os.path.join(settings.ML_MODEL_PATH, MODEL_FILENAME)
+
+
+def trailing_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """NaN-aware mean over the trailing ``window`` columns of each row"""
+    observed = ~np.isnan(values)
+    sums = np.cumsum(np.where(observed, values, 0.0), axis=1)
+    counts = np.cumsum(observed, axis=1)
+    sums[:, window:] -= sums[:, :-window].copy()
+    counts[:, window:] -= counts[:, :-window].copy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+class GlobalDemandModel:
+    """
+    Predicts occupancy rate from time, horizon, recent occupancy and lot features
+
+    Lot features are capacity, lot type, city and amenities, so lots without
+    any history still get a forecast from similar lots. Three models share the
+    same features: the mean and the 10th/90th percentiles for the bands.
+    """
+
+    version = "global_v1"
+
+    def __init__(self, horizon_steps: int = 16, max_iter: int = 300, max_amenities: int = 32):
+        self.horizon_steps = horizon_steps
+        self.max_iter = max_iter
+        self.max_amenities = max_amenities
+        self.lot_types = [lot_type.value for lot_type in LotType]
+        self.cities: Dict[str, int] = {}
+        self.amenities: List[str] = []
+        self.models: Dict[str, HistGradientBoostingRegressor] = {}
+        self.trained_at: Optional[datetime] = None
+
+    # Feature construction
+
+    def _lot_features(self, lots) -> np.ndarray:
+        """(lots, features): capacity, lot type one-hot, city code, amenity multi-hot"""
+        n_types = len(self.lot_types)
+        features = np.zeros((len(lots), 2 + n_types + len(self.amenities)))
+        amenity_index = {name: i for i, name in enumerate(self.amenities)}
+
+        for i, lot in enumerate(lots):
+            features[i, 0] = lot.total_slots
+            lot_type = lot.lot_type.value if isinstance(lot.lot_type, LotType) else lot.lot_type
+            if lot_type in self.lot_types:
+                features[i, 1 + self.lot_types.index(lot_type)] = 1
+            # Unknown cities are missing values for the categorical split
+            features[i, 1 + n_types] = self.cities.get((lot.city or "").lower(), np.nan)
+            for amenity in lot.amenities or []:
+                if amenity in amenity_index:
+                    features[i, 2 + n_types + amenity_index[amenity]] = 1
+
+        return features
+
+    def _design(self, lot_features: np.ndarray, lot_rows: np.ndarray, target_buckets: np.ndarray,
+                horizons: np.ndarray, recent_rates: np.ndarray) -> np.ndarray:
+        how = hour_of_week(target_buckets)
+        day_angle = 2 * np.pi * (how % 24) / 24
+        week_angle = 2 * np.pi * how / HOURS_PER_WEEK
+
+        time_features = np.column_stack([
+            np.sin(day_angle), np.cos(day_angle),
+            np.sin(week_angle), np.cos(week_angle),
+            horizons, recent_rates
+        ])
+        return np.hstack([time_features, lot_features[lot_rows]])
+
+    def _categorical_mask(self, n_lot_features: int) -> np.ndarray:
+        mask = np.zeros(6 + n_lot_features, dtype=bool)
+        mask[6 + 1 + len(self.lot_types)] = True
+        return mask
+
+    # Training
+
+    def fit(self, matrix: OccupancyMatrix, lots, n_samples: int = 200_000, seed: int = 42) -> "GlobalDemandModel":
+        """Train on randomly sampled (lot, origin, horizon) triples from the occupancy matrix"""
+        rng = np.random.default_rng(seed)
+        lot_by_id = {lot.id: lot for lot in lots}
+        keep = np.array([int(lot_id) in lot_by_id for lot_id in matrix.lot_ids], dtype=bool)
+        lot_ids = matrix.lot_ids[keep]
+        train_lots = [lot_by_id[int(lot_id)] for lot_id in lot_ids]
+
+        # Categorical splits support up to 255 categories; rarer cities become missing
+        city_counts: Dict[str, int] = {}
+        amenity_counts: Dict[str, int] = {}
+        for lot in lots:
+            if lot.city:
+                city = lot.city.lower()
+                city_counts[city] = city_counts.get(city, 0) + 1
+            for amenity in lot.amenities or []:
+                amenity_counts[amenity] = amenity_counts.get(amenity, 0) + 1
+        top_cities = sorted(city_counts, key=city_counts.get, reverse=True)[:MAX_CITIES]
+        self.cities = {city: i for i, city in enumerate(sorted(top_cities))}
+        self.amenities = sorted(amenity_counts, key=amenity_counts.get, reverse=True)[:self.max_amenities]
+
+        capacity = np.array([lot.total_slots for lot in train_lots], dtype=np.float64)
+        rates = matrix.values[keep] / np.maximum(capacity, 1)[:, None]
+        recent = trailing_mean(rates, RECENT_BUCKETS)
+        n_lots, n_buckets = rates.shape
+        if n_lots == 0 or n_buckets <= self.horizon_steps:
+            raise ValueError("Not enough occupancy history to train the global demand model")
+
+        # Oversample, then keep only triples whose target bucket was observed
+        draws = n_samples * 2
+        lot_rows = rng.integers(0, n_lots, draws)
+        origins = rng.integers(0, n_buckets - self.horizon_steps, draws)
+        horizons = rng.integers(1, self.horizon_steps + 1, draws)
+        targets = rates[lot_rows, origins + horizons]
+        observed = ~np.isnan(targets)
+
+        lot_rows, origins, horizons, targets = (
+            lot_rows[observed][:n_samples], origins[observed][:n_samples],
+            horizons[observed][:n_samples], targets[observed][:n_samples]
+        )
+        recent_rates = recent[lot_rows, origins]
+        recent_rates[rng.random(len(recent_rates)) < COLD_START_FRACTION] = np.nan
+
+        lot_features = self._lot_features(train_lots)
+        X = self._design(lot_features, lot_rows, matrix.start_bucket + origins + horizons, horizons, recent_rates)
+        categorical = self._categorical_mask(lot_features.shape[1])
+
+        losses = {
+            "mean": {"loss": "squared_error"},
+            "lower": {"loss": "quantile", "quantile": 0.1},
+            "upper": {"loss": "quantile", "quantile": 0.9},
+        }
+        self.models = {
+            name: HistGradientBoostingRegressor(
+                max_iter=self.max_iter,
+                categorical_features=categorical,
+                random_state=seed,
+                **params
+            ).fit(X, targets)
+            for name, params in losses.items()
+        }
+        self.trained_at = datetime.utcnow()
+        logger.info(f"Trained global demand model on {len(targets)} samples from {n_lots} lots")
+        return self
+
+    # Inference
+
+    def predict(self, lots, recent_occupancy: Dict[int, float], start: datetime, steps: int) -> np.ndarray:
+        """
+        Forecast every lot in one batched call
+
+        ``recent_occupancy`` maps lot id to its average occupied count over
+        the last hour; lots missing from it are forecast as cold starts.
+        Returns occupied counts with shape (lots, 3, steps).
+        """
+        n_lots = len(lots)
+        lot_features = self._lot_features(lots)
+        capacity = lot_features[:, 0]
+        recent = np.array([recent_occupancy.get(lot.id, np.nan) for lot in lots], dtype=np.float64)
+        recent_rates = recent / np.maximum(capacity, 1)
+
+        buckets = to_bucket(start) + np.arange(steps)
+        horizons = np.minimum(np.arange(1, steps + 1), self.horizon_steps)
+
+        X = self._design(
+            lot_features,
+            np.repeat(np.arange(n_lots), steps),
+            np.tile(buckets, n_lots),
+            np.tile(horizons, n_lots),
+            np.repeat(recent_rates, steps)
+        )
+
+        result = np.stack([
+            self.models[name].predict(X).reshape(n_lots, steps)
+            for name in ("mean", "lower", "upper")
+        ], axis=1)
+        result = np.clip(result, 0, 1) * capacity[:, None, None]
+
+        # Keep lower <= mean <= upper even where the quantile models cross
+        result[:, 1] = np.minimum(result[:, 1], result[:, 0])
+        result[:, 2] = np.maximum(result[:, 2], result[:, 0])
+        return result
+
+    # Persistence
+
+    def save(self, path: Optional[str] = None):
+        path = path or model_path()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        joblib.dump(self, path)
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> "GlobalDemandModel":
+        return joblib.load(path or model_path())
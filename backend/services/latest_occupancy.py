@@ -0,0 +1,148 @@
+"""
+Latest Occupancy Cache
+Most recent reading per lot, kept in memory and updated on ingest so the
+latest-occupancy endpoint never touches the database
+"""
+
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional
+
+from core.database import SessionLocal
+from core.redis_client import get_redis
+from models.models import OccupancyLog
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY = "occupancy:latest"
+
+# Writes each (lot, ts, reading) unless the hash holds a newer reading for
+# the lot ("newer"), or holds any reading for it ("missing")
+SET_LATEST_SCRIPT = """
+local written = 0
+for i = 2, #ARGV, 3 do
+    local current = redis.call('HGET', KEYS[1], ARGV[i])
+    local write = not current
+    if current and ARGV[1] == 'newer' then
+        local ts = cjson.decode(current)['ts']
+        write = not ts or tonumber(ts) <= tonumber(ARGV[i + 1])
+    end
+    if write then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 2])
+        written = written + 1
+    end
+end
+return written
+"""
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _sort_key(timestamp: datetime) -> datetime:
+    """Comparable form of naive (UTC) and aware timestamps"""
+    if timestamp.tzinfo is not None:
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def _epoch_us(timestamp: datetime) -> int:
+    return (_sort_key(timestamp) - EPOCH) // timedelta(microseconds=1)
+
+
+def _encode(reading: dict) -> str:
+    # ``ts`` lets the Redis script compare readings without parsing timestamps
+    return json.dumps({
+        **reading,
+        "timestamp": reading["timestamp"].isoformat(),
+        "ts": _epoch_us(reading["timestamp"])
+    })
+
+
+def _decode(value: str) -> dict:
+    reading = json.loads(value)
+    reading.pop("ts", None)
+    reading["timestamp"] = datetime.fromisoformat(reading["timestamp"])
+    return reading
+
+
+class LatestOccupancyCache:
+    """
+    Latest occupancy reading per lot
+
+    Readings live in a local dict. With Redis enabled every update is
+    mirrored to one hash and reads go to that hash, so all workers see
+    readings ingested by any of them; the local dict then serves as the
+    fallback when Redis is unreachable. The newer-than check runs inside
+    Redis, since another worker may hold a newer reading than this one.
+    """
+
+    def __init__(self):
+        self._latest: Dict[int, dict] = {}
+
+    async def record(self, readings: Iterable[dict], only_missing: bool = False):
+        """
+        Keep the newest of ``readings`` per lot (rows as queued for occupancy_logs)
+
+        With ``only_missing`` the shared hash is written only for lots it
+        does not hold yet (warming from the database, which lags ingest).
+        """
+        changed: Dict[int, dict] = {}
+        for reading in readings:
+            lot_id = reading["lot_id"]
+            current = self._latest.get(lot_id)
+            if current is None or _sort_key(reading["timestamp"]) >= _sort_key(current["timestamp"]):
+                self._latest[lot_id] = changed[lot_id] = reading
+
+        client = get_redis()
+        if client is not None and changed:
+            try:
+                args = ["missing" if only_missing else "newer"]
+                for lot_id, reading in changed.items():
+                    args += [str(lot_id), _epoch_us(reading["timestamp"]), _encode(reading)]
+                await client.register_script(SET_LATEST_SCRIPT)(keys=[REDIS_KEY], args=args)
+            except Exception as e:
+                logger.warning(f"Failed to mirror latest occupancy to Redis: {e}")
+
+    async def get(self, lot_id: int) -> Optional[dict]:
+        client = get_redis()
+        if client is not None:
+            try:
+                value = await client.hget(REDIS_KEY, str(lot_id))
+                if value is not None:
+                    return _decode(value)
+            except Exception as e:
+                logger.warning(f"Failed to read latest occupancy from Redis: {e}")
+        return self._latest.get(lot_id)
+
+    async def warm(self):
+        """Load the latest reading of every lot with one DISTINCT ON query"""
+        readings = await asyncio.to_thread(self._load)
+        await self.record(readings, only_missing=True)
+        logger.info(f"Warmed latest occupancy for {len(readings)} lots")
+
+    @staticmethod
+    def _load():
+        db = SessionLocal()
+        try:
+            logs = db.query(OccupancyLog).distinct(OccupancyLog.lot_id).order_by(
+                OccupancyLog.lot_id,
+                OccupancyLog.timestamp.desc()
+            ).all()
+            return [
+                {
+                    "lot_id": log.lot_id,
+                    "timestamp": log.timestamp,
+                    "occupied_count": log.occupied_count,
+                    "total_capacity": log.total_capacity,
+                    "sensor_data": log.sensor_data or {}
+                }
+                for log in logs
+            ]
+        finally:
+            db.close()
+
+
+# Singleton instance
+latest_occupancy_cache = LatestOccupancyCache()
@@ -0,0 +1,140 @@
+"""
+Occupancy Deduplication
+Drops gateway retries before they reach the write pipeline, keyed by
+(gateway, sequence)
+"""
+
+import logging
+from collections import OrderedDict
+from typing import List, Tuple
+
+from core.config import settings
+from core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = "occupancy:seq"
+
+DedupKey = Tuple[str, int]
+
+
+class SequenceWindow:
+    """
+    Sliding window of the last ``size`` sequence numbers of one gateway
+
+    Bit ``i`` of ``bits`` records whether ``highest - i`` was seen. A
+    sequence far below the window means the gateway restarted its counter,
+    so the window starts over from it.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.mask = (1 << size) - 1
+        self.highest = -1
+        self.bits = 0
+
+    def claim(self, sequence: int) -> bool:
+        """Mark ``sequence`` as seen; returns False if it already was"""
+        if sequence > self.highest:
+            shift = sequence - self.highest
+            self.bits = ((self.bits << shift) | 1) & self.mask if shift < self.size else 1
+            self.highest = sequence
+            return True
+
+        offset = self.highest - sequence
+        if offset >= self.size:
+            self.highest = sequence
+            self.bits = 1
+            return True
+
+        bit = 1 << offset
+        if self.bits & bit:
+            return False
+        self.bits |= bit
+        return True
+
+    def release(self, sequence: int):
+        offset = self.highest - sequence
+        if 0 <= offset < self.size:
+            self.bits &= ~(1 << offset)
+
+
+class OccupancyDeduplicator:
+    """
+    Remembers recent (gateway, sequence) keys
+
+    In memory, each gateway gets a ``SequenceWindow`` and the least recently
+    active gateways are evicted beyond ``max_gateways``. With Redis enabled
+    keys are claimed with SET NX and expire after ``ttl_seconds`` so every
+    worker shares them.
+    """
+
+    def __init__(self, window: int, max_gateways: int, ttl_seconds: int):
+        self.window = window
+        self.max_gateways = max_gateways
+        self.ttl_seconds = ttl_seconds
+        self._gateways: "OrderedDict[str, SequenceWindow]" = OrderedDict()
+
+        # Counters for monitoring
+        self.duplicates = 0
+
+    async def claim(self, keys: List[DedupKey]) -> List[bool]:
+        """Claim each key; False marks a duplicate (also within ``keys``)"""
+        client = get_redis()
+        if client is not None:
+            try:
+                fresh = await self._claim_redis(client, keys)
+            except Exception as e:
+                logger.warning(f"Redis dedup unavailable, using local windows: {e}")
+                fresh = self._claim_local(keys)
+        else:
+            fresh = self._claim_local(keys)
+
+        self.duplicates += fresh.count(False)
+        return fresh
+
+    async def release(self, keys: List[DedupKey]):
+        """Forget keys whose readings were not accepted, so the gateway's retry goes through"""
+        client = get_redis()
+        if client is not None:
+            try:
+                await client.delete(*(self._redis_key(key) for key in keys))
+            except Exception as e:
+                logger.warning(f"Failed to release dedup keys in Redis: {e}")
+        for gateway_id, sequence in keys:
+            window = self._gateways.get(gateway_id)
+            if window is not None:
+                window.release(sequence)
+
+    def _claim_local(self, keys: List[DedupKey]) -> List[bool]:
+        fresh = []
+        for gateway_id, sequence in keys:
+            window = self._gateways.get(gateway_id)
+            if window is None:
+                window = self._gateways[gateway_id] = SequenceWindow(self.window)
+                if len(self._gateways) > self.max_gateways:
+                    self._gateways.popitem(last=False)
+            else:
+                self._gateways.move_to_end(gateway_id)
+            fresh.append(window.claim(sequence))
+        return fresh
+
+    async def _claim_redis(self, client, keys: List[DedupKey]) -> List[bool]:
+        async with client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.set(self._redis_key(key), 1, nx=True, ex=self.ttl_seconds)
+            results = await pipe.execute()
+        return [bool(result) for result in results]
+
+    @staticmethod
+    def _redis_key(key: DedupKey) -> str:
+        gateway_id, sequence = key
+        return f"{REDIS_KEY_PREFIX}:{gateway_id}:{sequence}"
+
+
+# Singleton instance
+occupancy_deduplicator = OccupancyDeduplicator(
+    window=settings.OCCUPANCY_DEDUP_WINDOW,
+    max_gateways=settings.OCCUPANCY_DEDUP_MAX_GATEWAYS,
+    ttl_seconds=settings.OCCUPANCY_DEDUP_TTL_SECONDS
+)
@@ -0,0 +1,146 @@
+"""
+Occupancy Export Service
+Streams occupancy readings for bulk pulls as NDJSON, CSV or Arrow IPC
+with a server-side cursor, so memory stays flat for any time range
+"""
+
+import csv
+import enum
+import io
+import json
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional, Sequence
+
+from sqlalchemy import select
+
+from core.config import settings
+from core.database import SessionLocal
+from models.models import OccupancyLog, OccupancyLogArchive
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow export is optional
+    pa = None
+
+COLUMNS = ["lot_id", "timestamp", "occupied_count", "total_capacity", "sensor_data"]
+
+
+class ExportFormat(str, enum.Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+    ARROW = "arrow"
+
+
+MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv",
+    ExportFormat.ARROW: "application/vnd.apache.arrow.stream",
+}
+
+
+def arrow_available() -> bool:
+    return pa is not None
+
+
+def _select(model, start: datetime, end: datetime, lot_ids: Optional[List[int]]):
+    query = select(*(getattr(model, column) for column in COLUMNS)).where(
+        model.timestamp >= start,
+        model.timestamp < end
+    )
+    if lot_ids:
+        query = query.where(model.lot_id.in_(lot_ids))
+    return query.order_by(model.timestamp, model.id)
+
+
+def iter_occupancy_chunks(start: datetime, end: datetime, lot_ids: Optional[List[int]] = None,
+                          chunk_size: int = 10000) -> Iterator[Sequence]:
+    """
+    Yield readings in ``[start, end)`` as lists of row tuples, in timestamp order
+
+    Uses its own session because the response outlives the request's
+    dependencies. Without TimescaleDB, readings older than the raw
+    retention window are read from the archive table first.
+    """
+    sources = [OccupancyLog]
+    if not settings.TIMESCALE_ENABLED and start < datetime.utcnow() - timedelta(days=settings.OCCUPANCY_RAW_RETENTION_DAYS):
+        sources.insert(0, OccupancyLogArchive)
+
+    db = SessionLocal()
+    try:
+        for model in sources:
+            result = db.execute(
+                _select(model, start, end, lot_ids).execution_options(yield_per=chunk_size)
+            )
+            yield from result.partitions()
+    finally:
+        db.close()
+
+
+def ndjson_stream(chunks: Iterator[Sequence]) -> Iterator[bytes]:
+    for rows in chunks:
+        yield "".join(
+            json.dumps({
+                "lot_id": lot_id,
+                "timestamp": timestamp.isoformat(),
+                "occupied_count": occupied_count,
+                "total_capacity": total_capacity,
+                "sensor_data": sensor_data
+            }) + "\n"
+            for lot_id, timestamp, occupied_count, total_capacity, sensor_data in rows
+        ).encode()
+
+
+def csv_stream(chunks: Iterator[Sequence]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for rows in chunks:
+        writer.writerows(
+            (lot_id, timestamp.isoformat(), occupied_count, total_capacity, json.dumps(sensor_data))
+            for lot_id, timestamp, occupied_count, total_capacity, sensor_data in rows
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only when there were no rows
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def arrow_stream(chunks: Iterator[Sequence]) -> Iterator[bytes]:
+    """Arrow IPC stream: the schema, then one record batch per chunk"""
+    schema = pa.schema([
+        ("lot_id", pa.int32()),
+        ("timestamp", pa.timestamp("us", tz="UTC")),
+        ("occupied_count", pa.int32()),
+        ("total_capacity", pa.int32()),
+        ("sensor_data", pa.string()),  # JSON text
+    ])
+    sink = io.BytesIO()
+
+    def drain() -> bytes:
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    with pa.ipc.new_stream(sink, schema) as writer:
+        yield drain()
+        for rows in chunks:
+            lot_ids, timestamps, occupied, capacity, sensor_data = zip(*rows)
+            writer.write_batch(pa.record_batch([
+                pa.array(lot_ids, pa.int32()),
+                pa.array(timestamps, pa.timestamp("us", tz="UTC")),
+                pa.array(occupied, pa.int32()),
+                pa.array(capacity, pa.int32()),
+                pa.array([json.dumps(data) for data in sensor_data], pa.string()),
+            ], schema=schema))
+            yield drain()
+    yield drain()
+
+
+ENCODERS = {
+    ExportFormat.NDJSON: ndjson_stream,
+    ExportFormat.CSV: csv_stream,
+    ExportFormat.ARROW: arrow_stream,
+}
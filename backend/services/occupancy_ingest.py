@@ -0,0 +1,71 @@
+"""
+Occupancy Ingest Service
+Validates occupancy readings from edge gateways and buffers them for bulk writes
+"""
+
+import asyncio
+import logging
+import time
+from typing import List, Set
+
+from core.config import settings
+from core.database import SessionLocal
+from core.write_behind import WriteBehindQueue
+from models.models import OccupancyLog, ParkingLot
+
+logger = logging.getLogger(__name__)
+
+
+class LotIdCache:
+    """
+    Cached set of parking lot IDs used to validate readings without a lookup
+
+    The set is reloaded after ``ttl_seconds``, or early when an unknown ID
+    shows up (at most once per ``miss_refresh_seconds``) so newly created
+    lots are picked up quickly.
+    """
+
+    def __init__(self, ttl_seconds: float, miss_refresh_seconds: float = 5.0):
+        self.ttl_seconds = ttl_seconds
+        self.miss_refresh_seconds = miss_refresh_seconds
+        self._ids: Set[int] = set()
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def valid_ids(self, lot_ids: List[int]) -> Set[int]:
+        """Return the subset of ``lot_ids`` that exist"""
+        age = time.monotonic() - self._loaded_at
+        if age > self.ttl_seconds:
+            await self._reload()
+        elif age > self.miss_refresh_seconds and not self._ids.issuperset(lot_ids):
+            await self._reload()
+        return self._ids.intersection(lot_ids)
+
+    def invalidate(self):
+        self._loaded_at = 0.0
+
+    async def _reload(self):
+        async with self._lock:
+            self._ids = await asyncio.to_thread(self._load)
+            self._loaded_at = time.monotonic()
+
+    @staticmethod
+    def _load() -> Set[int]:
+        db = SessionLocal()
+        try:
+            return {lot_id for (lot_id,) in db.query(ParkingLot.id).all()}
+        finally:
+            db.close()
+
+
+# Singleton instances
+lot_id_cache = LotIdCache(ttl_seconds=settings.OCCUPANCY_LOT_CACHE_SECONDS)
+
+occupancy_writer = WriteBehindQueue(
+    name="occupancy_logs",
+    model=OccupancyLog,
+    max_batch=settings.OCCUPANCY_FLUSH_BATCH_SIZE,
+    flush_interval=settings.OCCUPANCY_FLUSH_SECONDS,
+    max_pending=settings.OCCUPANCY_BUFFER_MAX_READINGS,
+    max_retries=settings.OCCUPANCY_FLUSH_MAX_RETRIES
+)
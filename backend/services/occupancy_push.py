@@ -0,0 +1,154 @@
+"""
+Occupancy Push Service
+Coalesces occupancy readings and slot status changes per lot and pushes
+them to the lot's WebSocket subscribers at most once per window
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+
+from core.config import settings
+from core.database import SessionLocal
+from core.websocket_manager import lot_topic, manager
+from models.models import ParkingSlot
+from services.latest_occupancy import latest_occupancy_cache
+from services.slot_grid import slot_grid
+
+logger = logging.getLogger(__name__)
+
+
+class OccupancyPublisher:
+    """
+    Latest-state-wins push of per-lot updates
+
+    ``record_readings`` only marks a lot dirty (the reading itself is read
+    back from the latest-occupancy cache at flush) and ``record_slot``
+    overwrites the pending status of a slot. A background task flushes as
+    soon as something is pending, then waits ``window_seconds`` before the
+    next flush, so a chatty lot costs its subscribers at most one occupancy
+    message and one slot message per window, each carrying the newest state.
+    """
+
+    def __init__(self, window_seconds: float):
+        self.window_seconds = window_seconds
+        self._occupancy: Set[int] = set()
+        self._slots: Dict[int, Dict[int, Tuple[str, str]]] = {}
+        self._dirty = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Counters for monitoring
+        self.received = 0
+        self.pushed = 0
+
+    def record_readings(self, readings: Iterable[dict]):
+        """Mark the lots of ``readings`` (rows as queued for occupancy_logs) for a push"""
+        if not self._on_loop():
+            self._loop.call_soon_threadsafe(self.record_readings, list(readings))
+            return
+        for reading in readings:
+            self._occupancy.add(reading["lot_id"])
+            self.received += 1
+        self._wake()
+
+    def record_slot(self, lot_id: int, slot_id: int, status: str, vehicle_type: str):
+        if not self._on_loop():
+            self._loop.call_soon_threadsafe(self.record_slot, lot_id, slot_id, status, vehicle_type)
+            return
+        self._slots.setdefault(lot_id, {})[slot_id] = (status, vehicle_type)
+        self.received += 1
+        self._wake()
+
+    def start(self):
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _on_loop(self) -> bool:
+        """False on worker threads (commits inside asyncio.to_thread), whose records must hop to the loop"""
+        if self._loop is None:
+            return True
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _wake(self):
+        if self._loop is not None:
+            self._dirty.set()
+
+    async def _run(self):
+        while True:
+            await self._dirty.wait()
+            self._dirty.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Occupancy push failed: {e}", exc_info=True)
+            await asyncio.sleep(self.window_seconds)
+
+    async def flush(self):
+        occupancy, self._occupancy = self._occupancy, set()
+        slots, self._slots = self._slots, {}
+
+        for lot_id in occupancy:
+            if not manager.has_subscribers(lot_topic("occupancy", lot_id)):
+                continue
+            reading = await latest_occupancy_cache.get(lot_id)
+            if reading is None:
+                continue
+            capacity = reading["total_capacity"]
+            await manager.send_occupancy_update(str(lot_id), {
+                "lot_id": lot_id,
+                "timestamp": reading["timestamp"].isoformat(),
+                "occupied_count": reading["occupied_count"],
+                "total_capacity": capacity,
+                "occupancy_rate": reading["occupied_count"] / capacity if capacity > 0 else 0
+            })
+            self.pushed += 1
+
+        for lot_id, changes in slots.items():
+            await slot_grid.publish(lot_id, changes)
+            if not manager.has_subscribers(lot_topic("slots", lot_id)):
+                continue
+            await manager.send_slot_update(str(lot_id), {
+                "timestamp": datetime.utcnow().isoformat(),
+                "slots": [{"slot_id": slot_id, "status": status} for slot_id, (status, _) in changes.items()]
+            })
+            self.pushed += 1
+
+
+# Singleton instance
+occupancy_publisher = OccupancyPublisher(window_seconds=settings.OCCUPANCY_PUSH_WINDOW_MS / 1000)
+
+
+# Slot status changes are collected on the session and published only once committed
+
+@event.listens_for(ParkingSlot.status, "set")
+def _slot_status_changed(target, value, oldvalue, initiator):
+    session = object_session(target)
+    if session is None or target.id is None or value == oldvalue:
+        return
+    session.info.setdefault("slot_changes", {})[target.id] = (target.lot_id, value, target.vehicle_type)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _publish_slot_changes(session):
+    for slot_id, (lot_id, status, vehicle_type) in session.info.pop("slot_changes", {}).items():
+        occupancy_publisher.record_slot(lot_id, slot_id, getattr(status, "value", status), vehicle_type)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_slot_changes(session):
+    session.info.pop("slot_changes", None)
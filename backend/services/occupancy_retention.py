@@ -0,0 +1,231 @@
+"""
+Occupancy Retention Service
+Keeps the raw occupancy_logs table bounded and reports the storage and
+query time this saves
+
+With TimescaleDB the work is done by native compression and retention
+policies (see core.timescale). On plain PostgreSQL a background job moves
+expired readings to occupancy_logs_archive in small batches instead.
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import text
+
+from core.config import settings
+from core.database import SessionLocal
+from core.timescale import OCCUPANCY_ROLLUPS
+
+logger = logging.getLogger(__name__)
+
+# One short transaction per batch; SKIP LOCKED lets concurrent workers share
+# the backlog and never waits on rows another session holds
+ARCHIVE_BATCH_SQL = text("""
+    WITH moved AS (
+        DELETE FROM occupancy_logs
+        WHERE ctid IN (
+            SELECT ctid FROM occupancy_logs
+            WHERE timestamp < :cutoff
+            LIMIT :batch_size
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, lot_id, timestamp, occupied_count, total_capacity, sensor_data
+    ), archived AS (
+        INSERT INTO occupancy_logs_archive (id, lot_id, timestamp, occupied_count, total_capacity, sensor_data)
+        SELECT id, lot_id, timestamp, occupied_count, total_capacity, sensor_data FROM moved
+        ON CONFLICT DO NOTHING
+    )
+    SELECT count(*) FROM moved
+""")
+
+PURGE_BATCH_SQL = text("""
+    WITH purged AS (
+        DELETE FROM occupancy_logs_archive
+        WHERE ctid IN (
+            SELECT ctid FROM occupancy_logs_archive
+            WHERE timestamp < :cutoff
+            LIMIT :batch_size
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING 1
+    )
+    SELECT count(*) FROM purged
+""")
+
+# Per-lot aggregate used to compare scan times
+RAW_AGGREGATE = """
+    SELECT lot_id, count(*), avg(occupied_count)
+    FROM {source}
+    WHERE timestamp >= :since
+    GROUP BY lot_id
+"""
+
+
+def _timed_ms(db, sql: str, params: dict) -> float:
+    """Run once to warm the cache, then time a second run"""
+    db.execute(text(sql), params).all()
+    started = time.perf_counter()
+    db.execute(text(sql), params).all()
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+def _relation_stats(db, relation: str) -> Dict[str, int]:
+    row = db.execute(
+        text("SELECT reltuples::bigint, pg_total_relation_size(oid) FROM pg_class WHERE relname = :relation"),
+        {"relation": relation}
+    ).first()
+    return {"rows": max(row[0], 0) if row else 0, "total_bytes": row[1] if row else 0}
+
+
+class OccupancyRetention:
+    """Runs the archive job on plain PostgreSQL and builds the storage report"""
+
+    def __init__(self):
+        self.last_run: Optional[Dict] = None
+
+    def run(self, db, now: Optional[datetime] = None) -> Dict:
+        """Archive expired raw readings, then purge archived readings past rollup retention"""
+        now = now or datetime.utcnow()
+        started = time.perf_counter()
+        batch_size = settings.OCCUPANCY_ARCHIVE_BATCH_SIZE
+
+        archived = self._drain(db, ARCHIVE_BATCH_SQL, now - timedelta(days=settings.OCCUPANCY_RAW_RETENTION_DAYS), batch_size)
+        purged = self._drain(db, PURGE_BATCH_SQL, now - timedelta(days=settings.OCCUPANCY_ROLLUP_RETENTION_DAYS), batch_size)
+
+        self.last_run = {
+            "finished_at": datetime.utcnow(),
+            "archived_rows": archived,
+            "purged_rows": purged,
+            "seconds": round(time.perf_counter() - started, 3)
+        }
+        return self.last_run
+
+    @staticmethod
+    def _drain(db, statement, cutoff: datetime, batch_size: int) -> int:
+        total = 0
+        while True:
+            moved = db.execute(statement, {"cutoff": cutoff, "batch_size": batch_size}).scalar()
+            db.commit()
+            total += moved
+            if moved < batch_size:
+                return total
+
+    def storage_report(self, db) -> Dict:
+        """Table sizes, what retention has saved, and the scan time of a bounded vs unbounded table"""
+        if settings.TIMESCALE_ENABLED:
+            report = self._timescale_report(db)
+        else:
+            report = self._archive_report(db)
+
+        report["raw_retention_days"] = settings.OCCUPANCY_RAW_RETENTION_DAYS
+        report["rollup_retention_days"] = settings.OCCUPANCY_ROLLUP_RETENTION_DAYS
+        return report
+
+    def _archive_report(self, db) -> Dict:
+        live = _relation_stats(db, "occupancy_logs")
+        archive = _relation_stats(db, "occupancy_logs_archive")
+        since = datetime.utcnow() - timedelta(days=settings.OCCUPANCY_ROLLUP_RETENTION_DAYS)
+
+        live_ms = _timed_ms(db, RAW_AGGREGATE.format(source="occupancy_logs"), {"since": since})
+        unbounded_ms = _timed_ms(db, RAW_AGGREGATE.format(
+            source="(SELECT lot_id, timestamp, occupied_count FROM occupancy_logs "
+                   "UNION ALL SELECT lot_id, timestamp, occupied_count FROM occupancy_logs_archive) AS history"
+        ), {"since": since})
+
+        return {
+            "mode": "archive",
+            "live": live,
+            "archive": archive,
+            "bytes_moved_out_of_live_table": archive["total_bytes"],
+            "last_run": self.last_run,
+            "query_benchmark": {
+                "query": "per-lot count and average over the full history window",
+                "live_table_ms": live_ms,
+                "without_retention_ms": unbounded_ms
+            }
+        }
+
+    def _timescale_report(self, db) -> Dict:
+        size = db.execute(text(
+            "SELECT approximate_row_count('occupancy_logs'), hypertable_size('occupancy_logs')"
+        )).first()
+        compression = db.execute(text("""
+            SELECT total_chunks, number_compressed_chunks,
+                   before_compression_total_bytes, after_compression_total_bytes
+            FROM hypertable_compression_stats('occupancy_logs')
+        """)).first()
+        jobs = db.execute(text("""
+            SELECT j.proc_name, j.hypertable_name, s.last_run_status, s.last_successful_finish, s.total_runs
+            FROM timescaledb_information.jobs j
+            JOIN timescaledb_information.job_stats s USING (job_id)
+            WHERE j.proc_name IN ('policy_compression', 'policy_retention')
+            ORDER BY j.job_id
+        """)).all()
+
+        before = (compression.before_compression_total_bytes or 0) if compression else 0
+        after = (compression.after_compression_total_bytes or 0) if compression else 0
+
+        # Same window read from raw chunks and from the hourly rollup
+        rollup = OCCUPANCY_ROLLUPS[-1]
+        window_days = min(30, settings.OCCUPANCY_RAW_RETENTION_DAYS)
+        since = datetime.utcnow() - timedelta(days=window_days)
+        raw_ms = _timed_ms(db, RAW_AGGREGATE.format(source="occupancy_logs"), {"since": since})
+        rollup_ms = _timed_ms(db, f"""
+            SELECT lot_id, sum(samples), sum(avg_occupied * samples) / sum(samples)
+            FROM {rollup.view}
+            WHERE bucket >= :since
+            GROUP BY lot_id
+        """, {"since": since})
+
+        return {
+            "mode": "timescale",
+            "live": {"rows": size[0], "total_bytes": size[1]},
+            "compression": {
+                "total_chunks": compression.total_chunks if compression else 0,
+                "compressed_chunks": compression.number_compressed_chunks if compression else 0,
+                "before_bytes": before,
+                "after_bytes": after,
+                "bytes_saved": before - after
+            },
+            "jobs": [dict(job._mapping) for job in jobs],
+            "query_benchmark": {
+                "query": f"per-lot count and average over {window_days} days",
+                "raw_ms": raw_ms,
+                f"{rollup.view}_ms": rollup_ms
+            }
+        }
+
+
+def _run_retention() -> Dict:
+    db = SessionLocal()
+    try:
+        return occupancy_retention.run(db)
+    finally:
+        db.close()
+
+
+async def run_occupancy_retention_loop():
+    """Background task that archives expired readings every OCCUPANCY_RETENTION_INTERVAL_MINUTES"""
+    if settings.TIMESCALE_ENABLED:
+        logger.info("Occupancy retention is handled by TimescaleDB policies")
+        return
+
+    while True:
+        try:
+            result = await asyncio.to_thread(_run_retention)
+            if result["archived_rows"] or result["purged_rows"]:
+                logger.info(
+                    f"Archived {result['archived_rows']} and purged {result['purged_rows']} "
+                    f"occupancy readings in {result['seconds']}s"
+                )
+        except Exception as e:
+            logger.error(f"Occupancy retention failed: {e}", exc_info=True)
+        await asyncio.sleep(settings.OCCUPANCY_RETENTION_INTERVAL_MINUTES * 60)
+
+
+# Singleton instance
+occupancy_retention = OccupancyRetention()
@@ -0,0 +1,212 @@
+"""
+Recent Occupancy Buffer
+Per-lot ring buffers of the last day of occupancy readings, kept as NumPy
+arrays so charts and feature builders read them without a database query
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+
+from core.config import settings
+from core.database import SessionLocal
+from models.models import OccupancyLog
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def epoch_seconds(ts: datetime) -> int:
+    """Epoch seconds of a naive (UTC) or aware timestamp"""
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return int((ts - EPOCH).total_seconds())
+
+
+class LotRing:
+    """
+    Fixed-size ring of (timestamp, occupied count) for one lot
+
+    Every value is written twice, at ``i`` and ``i + size``, so the newest
+    ``length`` values are always one contiguous slice and can be handed out
+    as views without copying. Arrays start small and double up to
+    ``max_size``. Readings older than the newest one are ignored to keep
+    timestamps sorted for binary search.
+    """
+
+    def __init__(self, max_size: int, initial_size: int = 64):
+        self.max_size = max_size
+        self.size = min(initial_size, max_size)
+        self.length = 0
+        self.total_capacity = 0
+        self._head = 0
+        self._timestamps = np.zeros(2 * self.size, dtype=np.int64)
+        self._counts = np.zeros(2 * self.size, dtype=np.int32)
+
+    @property
+    def last_timestamp(self) -> Optional[int]:
+        if self.length == 0:
+            return None
+        return int(self._timestamps[self._head + self.size - 1])
+
+    def append(self, timestamp: int, count: int) -> bool:
+        if self.length and timestamp < self.last_timestamp:
+            return False
+        if self.length == self.size and self.size < self.max_size:
+            self._resize(min(self.size * 2, self.max_size))
+
+        i = self._head
+        self._timestamps[i] = self._timestamps[i + self.size] = timestamp
+        self._counts[i] = self._counts[i + self.size] = count
+        self._head = (i + 1) % self.size
+        self.length = min(self.length + 1, self.size)
+        return True
+
+    def extend(self, timestamps: np.ndarray, counts: np.ndarray):
+        """Bulk load sorted readings into an empty ring"""
+        timestamps = timestamps[-self.max_size:]
+        counts = counts[-self.max_size:]
+        n = len(timestamps)
+        size = self.size
+        while size < n:
+            size *= 2
+        self._allocate(min(size, self.max_size))
+
+        self._timestamps[:n] = self._timestamps[self.size:self.size + n] = timestamps
+        self._counts[:n] = self._counts[self.size:self.size + n] = counts
+        self._head = n % self.size
+        self.length = n
+
+    def view(self, since: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Read-only (timestamps, counts) views, oldest first, optionally from ``since``"""
+        end = self._head + self.size
+        start = end - self.length
+        timestamps = self._timestamps[start:end]
+        if since is not None:
+            start += int(np.searchsorted(timestamps, since, side='left'))
+            timestamps = self._timestamps[start:end]
+        counts = self._counts[start:end]
+
+        timestamps.flags.writeable = False
+        counts.flags.writeable = False
+        return timestamps, counts
+
+    def _allocate(self, size: int):
+        self.size = size
+        self._timestamps = np.zeros(2 * size, dtype=np.int64)
+        self._counts = np.zeros(2 * size, dtype=np.int32)
+
+    def _resize(self, size: int):
+        timestamps, counts = self.view()
+        self.size = size
+        self.extend(timestamps.copy(), counts.copy())
+
+
+class RecentOccupancyBuffer:
+    """
+    Ring buffers for every lot that reported in the last ``window_hours``
+
+    Filled by the ingest endpoints and warmed from the database at startup.
+    Views returned by ``window`` alias the ring: use them straight away or
+    copy them, since later readings overwrite the oldest slots. Each worker
+    process holds its own buffers and sees the readings it ingested.
+    """
+
+    def __init__(self, window_hours: int, max_readings: int):
+        self.window_seconds = window_hours * 3600
+        self.max_readings = max_readings
+        self._rings: Dict[int, LotRing] = {}
+
+    def record(self, readings: Iterable[dict]):
+        """Append readings (rows as queued for occupancy_logs)"""
+        for reading in readings:
+            ring = self._rings.get(reading["lot_id"])
+            if ring is None:
+                ring = self._rings[reading["lot_id"]] = LotRing(self.max_readings)
+            ring.append(epoch_seconds(reading["timestamp"]), reading["occupied_count"])
+            ring.total_capacity = reading["total_capacity"]
+
+    def has_lot(self, lot_id: int) -> bool:
+        return lot_id in self._rings
+
+    def total_capacity(self, lot_id: int) -> int:
+        ring = self._rings.get(lot_id)
+        return ring.total_capacity if ring else 0
+
+    def window(self, lot_id: int, minutes: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Zero-copy (epoch seconds, occupied counts) for the last ``minutes`` (default: whole window)"""
+        ring = self._rings.get(lot_id)
+        if ring is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
+        seconds = self.window_seconds if minutes is None else min(minutes * 60, self.window_seconds)
+        return ring.view(since=int(time.time()) - seconds)
+
+    def mean(self, lot_ids: List[int], minutes: int) -> Dict[int, float]:
+        """Average occupied count per lot over the last ``minutes``; lots without readings are omitted"""
+        averages = {}
+        for lot_id in lot_ids:
+            _, counts = self.window(lot_id, minutes)
+            if len(counts):
+                averages[lot_id] = float(counts.mean())
+        return averages
+
+    async def warm(self):
+        """Load the last ``window_hours`` of readings for every lot"""
+        started = time.perf_counter()
+        readings = await asyncio.to_thread(self._load)
+        for lot_id, (timestamps, counts, total_capacity) in readings.items():
+            ring = LotRing(self.max_readings)
+            ring.extend(timestamps, counts)
+            ring.total_capacity = total_capacity
+            self._rings[lot_id] = ring
+        logger.info(f"Warmed recent occupancy for {len(readings)} lots in {time.perf_counter() - started:.2f}s")
+
+    def _load(self) -> Dict[int, Tuple[np.ndarray, np.ndarray, int]]:
+        since = datetime.utcnow() - timedelta(seconds=self.window_seconds)
+        query = select(
+            OccupancyLog.lot_id,
+            func.extract('epoch', OccupancyLog.timestamp),
+            OccupancyLog.occupied_count,
+            OccupancyLog.total_capacity
+        ).where(
+            OccupancyLog.timestamp >= since
+        ).order_by(OccupancyLog.lot_id, OccupancyLog.timestamp)
+
+        parts = []
+        db = SessionLocal()
+        try:
+            result = db.execute(query.execution_options(yield_per=50000))
+            for rows in result.partitions():
+                parts.append(np.array(rows, dtype=np.float64))
+        finally:
+            db.close()
+
+        if not parts:
+            return {}
+
+        data = np.concatenate(parts)
+        lot_ids = data[:, 0].astype(np.int64)
+        # Rows are sorted by lot, so each lot is one contiguous run
+        starts = np.flatnonzero(np.r_[True, lot_ids[1:] != lot_ids[:-1]])
+        ends = np.r_[starts[1:], len(lot_ids)]
+        return {
+            int(lot_ids[s]): (
+                data[s:e, 1].astype(np.int64),
+                data[s:e, 2].astype(np.int32),
+                int(data[e - 1, 3])
+            )
+            for s, e in zip(starts, ends)
+        }
+
+
+# Singleton instance
+recent_occupancy = RecentOccupancyBuffer(
+    window_hours=settings.OCCUPANCY_RING_HOURS,
+    max_readings=settings.OCCUPANCY_RING_MAX_READINGS
+)
@@ -0,0 +1,302 @@
+"""
+Slot Grid Service
+Versioned slot-status stream for the slot selection grid: a subscriber gets
+one snapshot, then only the slots that changed, and can resume after a
+reconnect from the last version it saw
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from fastapi import WebSocket
+from sqlalchemy import and_
+from sqlalchemy.orm import Session
+
+from core.config import settings
+from core.database import SessionLocal
+from core.redis_client import get_redis
+from core.websocket_manager import encode_message, manager
+from models.models import Booking, BookingStatus, ParkingSlot, SlotStatus
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "slots:"
+REDIS_VERSION_KEY = "slotgrid:version"
+
+VEHICLE_TYPES = ["2wheeler", "4wheeler", "others"]
+
+# (version, slot_id, status, vehicle_type)
+Delta = Tuple[int, int, str, str]
+
+
+def slot_status(status) -> str:
+    """Status as the slot APIs report it (upper case)"""
+    return (status.value if hasattr(status, 'value') else status).upper()
+
+
+def slot_payload(slot: ParkingSlot) -> dict:
+    return {
+        "id": slot.id,
+        "slot_number": slot.slot_number,
+        "vehicle_type": slot.vehicle_type,
+        "status": slot_status(slot.status),
+        "floor": slot.floor,
+        "zone": slot.zone,
+        "is_active": slot.is_active
+    }
+
+
+def release_expired_bookings(db: Session, lot_id: int) -> int:
+    """Complete bookings that ended over 5 minutes ago and free their slots"""
+    expired_cutoff = datetime.now(timezone.utc) - timedelta(minutes=5)
+
+    expired_bookings = db.query(Booking).filter(
+        and_(
+            Booking.lot_id == lot_id,
+            Booking.end_time <= expired_cutoff,
+            Booking.status.in_([BookingStatus.CONFIRMED, BookingStatus.ACTIVE])
+        )
+    ).all()
+
+    for booking in expired_bookings:
+        # Mark booking as completed
+        booking.status = BookingStatus.COMPLETED
+        # Release the slot
+        if booking.slot_id:
+            slot = db.query(ParkingSlot).filter(ParkingSlot.id == booking.slot_id).first()
+            if slot:
+                slot.status = SlotStatus.AVAILABLE
+
+    if expired_bookings:
+        db.commit()
+    return len(expired_bookings)
+
+
+class SlotGrid:
+    """
+    Per-lot slot versions, a bounded log of recent deltas and the grid subscribers
+
+    Every committed slot change gets the next version of its lot (a Redis
+    counter shared by all workers when Redis is enabled). Versions start
+    from the current time in microseconds, so they keep increasing across
+    restarts and an old version never matches a new change. Deltas travel
+    over the pub/sub backbone; each worker logs the last ``log_size`` per
+    lot and fans them out to its own subscribers, so a client can resume
+    from a version that is still in the log of whichever worker it reaches.
+    """
+
+    def __init__(self, log_size: int):
+        self.log_size = log_size
+        self._versions: Dict[int, int] = {}
+        self._logs: Dict[int, Deque[Delta]] = {}
+        # (lot_id, vehicle_type or None for all types) -> sockets
+        self._subscribers: Dict[Tuple[int, Optional[str]], Set[WebSocket]] = {}
+        # Version of the last delta message sent on each stream
+        self._sent: Dict[Tuple[int, Optional[str]], int] = {}
+        # lot_id -> subscribers registered or loading a snapshot; deltas are received while above zero
+        self._watchers: Dict[int, int] = {}
+        manager.pubsub.subscribe(self._on_deltas)
+
+        # Counters for monitoring
+        self.snapshots = 0
+        self.resumes = 0
+        self.resyncs = 0
+
+    async def publish(self, lot_id: int, changes: Dict[int, Tuple[str, str]]):
+        """Version and publish committed changes (slot_id -> (status, vehicle_type))"""
+        if not changes:
+            return
+        last = await self._allocate(lot_id, len(changes))
+        first = last - len(changes) + 1
+        deltas = [
+            [first + i, slot_id, slot_status(status), vehicle_type]
+            for i, (slot_id, (status, vehicle_type)) in enumerate(changes.items())
+        ]
+        await manager.pubsub.publish(f"{CHANNEL_PREFIX}{lot_id}", {"lot_id": lot_id, "deltas": deltas})
+
+    async def subscribe(self, websocket: WebSocket, lot_id: int, vehicle_type: Optional[str],
+                        since: Optional[int] = None):
+        """Register a connected socket, sending either the deltas after ``since`` or a snapshot"""
+        client = manager.clients.get(websocket)
+        if client is None:
+            return
+        self._watch(lot_id, 1)
+        try:
+            # Subscribed before the version is read, so no later delta is missed
+            await manager.pubsub.ensure_listening(f"{CHANNEL_PREFIX}{lot_id}")
+            await self._start_stream(client, websocket, lot_id, vehicle_type, since)
+        except BaseException:
+            self._watch(lot_id, -1)
+            raise
+
+    async def _start_stream(self, client, websocket: WebSocket, lot_id: int, vehicle_type: Optional[str],
+                            since: Optional[int]):
+        if since is not None:
+            missed = self._deltas_since(lot_id, since)
+            if missed is None and not self._logs.get(lot_id) and since == await self.current_version(lot_id):
+                missed = []
+            if missed is not None:
+                self.resumes += 1
+                client.enqueue(encode_message({
+                    "type": "slot_resumed",
+                    "lot_id": lot_id,
+                    "version": since
+                }))
+                self._send_deltas([client], lot_id, vehicle_type, missed, after=since)
+                self._register(websocket, lot_id, vehicle_type)
+                return
+
+        # Deltas arriving while the snapshot loads are replayed from the log after it
+        version = await self.current_version(lot_id)
+        slots = await asyncio.to_thread(self._load_slots, lot_id, vehicle_type)
+        self.snapshots += 1
+        client.enqueue(encode_message({
+            "type": "slot_snapshot",
+            "lot_id": lot_id,
+            "vehicle_type": vehicle_type,
+            "version": version,
+            "slots": slots
+        }))
+        later = [delta for delta in self._logs.get(lot_id, ()) if delta[0] > version]
+        self._send_deltas([client], lot_id, vehicle_type, later, after=version)
+        self._register(websocket, lot_id, vehicle_type)
+
+    def unsubscribe(self, websocket: WebSocket, lot_id: int, vehicle_type: Optional[str]):
+        sockets = self._subscribers.get((lot_id, vehicle_type))
+        if sockets is not None and websocket in sockets:
+            sockets.discard(websocket)
+            if not sockets:
+                del self._subscribers[(lot_id, vehicle_type)]
+            self._watch(lot_id, -1)
+
+    def _watch(self, lot_id: int, change: int):
+        """Receive a lot's deltas only while this worker has subscribers for it"""
+        count = self._watchers.get(lot_id, 0) + change
+        if count > 0:
+            if lot_id not in self._watchers:
+                manager.pubsub.listen(f"{CHANNEL_PREFIX}{lot_id}")
+            self._watchers[lot_id] = count
+        elif self._watchers.pop(lot_id, None) is not None:
+            manager.pubsub.unlisten(f"{CHANNEL_PREFIX}{lot_id}")
+            # Deltas stop arriving, so the log could no longer vouch for a resume
+            self._logs.pop(lot_id, None)
+
+    async def current_version(self, lot_id: int) -> int:
+        client = get_redis()
+        if client is not None:
+            try:
+                value = await client.get(f"{REDIS_VERSION_KEY}:{lot_id}")
+                if value is not None:
+                    return int(value)
+                return await self._allocate(lot_id, 0)
+            except Exception as e:
+                logger.warning(f"Redis slot version unavailable: {e}")
+        return self._versions.setdefault(lot_id, time.time_ns() // 1000)
+
+    async def _allocate(self, lot_id: int, count: int) -> int:
+        """Reserve ``count`` versions; returns the last one"""
+        client = get_redis()
+        if client is not None:
+            try:
+                key = f"{REDIS_VERSION_KEY}:{lot_id}"
+                async with client.pipeline(transaction=True) as pipe:
+                    pipe.set(key, time.time_ns() // 1000, nx=True)
+                    pipe.incrby(key, count)
+                    _, last = await pipe.execute()
+                return int(last)
+            except Exception as e:
+                logger.warning(f"Redis slot version unavailable, using local counter: {e}")
+        last = self._versions.setdefault(lot_id, time.time_ns() // 1000) + count
+        self._versions[lot_id] = last
+        return last
+
+    def _deltas_since(self, lot_id: int, since: int) -> Optional[List[Delta]]:
+        """Logged deltas after ``since``, or None if the log no longer covers it"""
+        log = self._logs.get(lot_id)
+        if not log or not log[0][0] - 1 <= since <= log[-1][0]:
+            return None
+        return [delta for delta in log if delta[0] > since]
+
+    async def _on_deltas(self, channel: str, payload: dict):
+        if not channel.startswith(CHANNEL_PREFIX):
+            return
+        lot_id = payload["lot_id"]
+        deltas = [tuple(delta) for delta in payload["deltas"]]
+
+        log = self._logs.get(lot_id)
+        if log is None:
+            log = self._logs[lot_id] = deque(maxlen=self.log_size)
+        elif log and deltas[0][0] != log[-1][0] + 1:
+            # Workers publish after allocating versions, so batches can be missed or
+            # arrive out of order. Subscribers may have skipped a change: have them
+            # take a new snapshot, and stop resuming from before this point.
+            ahead = deltas[0][0] > log[-1][0]
+            log.clear()
+            if ahead:
+                log.extend(deltas)
+            self._resync(lot_id)
+            return
+        log.extend(deltas)
+
+        for vehicle_type, clients in self._lot_clients(lot_id):
+            self._send_deltas(clients, lot_id, vehicle_type, deltas)
+
+    def _resync(self, lot_id: int):
+        self.resyncs += 1
+        text = encode_message({"type": "slot_resync", "lot_id": lot_id})
+        for _, clients in self._lot_clients(lot_id):
+            for client in clients:
+                client.enqueue(text)
+
+    def _lot_clients(self, lot_id: int):
+        """(vehicle_type, clients) of every stream on a lot"""
+        for (sub_lot, vehicle_type), sockets in list(self._subscribers.items()):
+            if sub_lot == lot_id:
+                yield vehicle_type, [manager.clients[ws] for ws in list(sockets) if ws in manager.clients]
+
+    def _send_deltas(self, clients, lot_id: int, vehicle_type: Optional[str],
+                     deltas: List[Delta], after: Optional[int] = None):
+        """Send deltas to ``clients``: a broadcast on the stream, or a replay to one client after version ``after``"""
+        changes = [
+            [slot_id, status, version] for version, slot_id, status, slot_type in deltas
+            if (after is None or version > after) and (vehicle_type is None or slot_type == vehicle_type)
+        ]
+        if not changes or not clients:
+            return
+        stream = (lot_id, vehicle_type)
+        # ``prev`` lets a client notice a dropped message: prev above its version means a gap
+        text = encode_message({
+            "type": "slot_delta",
+            "lot_id": lot_id,
+            "prev": self._sent.get(stream, 0) if after is None else after,
+            "version": changes[-1][2],
+            "changes": changes
+        })
+        self._sent[stream] = max(self._sent.get(stream, 0), changes[-1][2])
+        for client in clients:
+            client.enqueue(text)
+
+    def _register(self, websocket: WebSocket, lot_id: int, vehicle_type: Optional[str]):
+        self._subscribers.setdefault((lot_id, vehicle_type), set()).add(websocket)
+
+    def _load_slots(self, lot_id: int, vehicle_type: Optional[str]) -> List[dict]:
+        db = SessionLocal()
+        try:
+            release_expired_bookings(db, lot_id)
+            query = db.query(ParkingSlot).filter(
+                ParkingSlot.lot_id == lot_id,
+                ParkingSlot.is_active == True
+            )
+            if vehicle_type:
+                query = query.filter(ParkingSlot.vehicle_type == vehicle_type)
+            return [slot_payload(slot) for slot in query.order_by(ParkingSlot.id)]
+        finally:
+            db.close()
+
+
+# Singleton instance
+slot_grid = SlotGrid(log_size=settings.SLOT_GRID_LOG_SIZE)
@@ -12,10 +12,20 @@ document.addEventListener('DOMContentLoaded', () => {
     const startTime = urlParams.get('startTime');
     const endTime = urlParams.get('endTime');
     
+    // WebSocket base URL (same host as the API)
+    const WS_BASE = API_BASE.replace(/^http/, 'ws').replace(/\/v1$/, '');
+    
     // State
     let selectedSlot = null;
     let slots = [];
     
+    // Live slot stream: version of the last snapshot or delta applied
+    let slotVersion = null;
+    let slotSocket = null;
+    let reconnectDelay = 1000;
+    let usedRestFallback = false;
+    let leavingPage = false;
+    
     // Initialize page
     initializePage();
     
@@ -30,8 +40,8 @@ document.addEventListener('DOMContentLoaded', () => {
         // Update booking info display
         updateBookingInfo();
         
-        // Fetch and render slots
-        fetchSlots();
+        // Stream slots live (falls back to a one-off fetch)
+        connectSlotStream();
         
         // Setup event listeners
         setupEventListeners();
@@ -79,8 +89,7 @@ document.addEventListener('DOMContentLoaded', () => {
         try {
             container.innerHTML = '<div class="loading-message">Loading available slots from database...</div>';
             
-            // Map auto_truck to others for backend compatibility
-            const backendVehicleType = vehicleType === 'auto_truck' ? 'others' : vehicleType;
+            const backendVehicleType = toBackendVehicleType();
             
             // Fetch real slots from backend
             const response = await fetch(`${API_BASE}/lots/${locationId}/slots?vehicle_type=${backendVehicleType}`);
@@ -115,6 +124,125 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
     
+    function toBackendVehicleType() {
+        // Map auto_truck to others for backend compatibility
+        return vehicleType === 'auto_truck' ? 'others' : vehicleType;
+    }
+    
+    function connectSlotStream() {
+        if (!('WebSocket' in window)) {
+            fetchSlots();
+            return;
+        }
+        
+        let url = `${WS_BASE}/ws/slots/${locationId}?vehicle_type=${toBackendVehicleType()}`;
+        if (slotVersion !== null) {
+            // Resume: the server sends only what changed since this version
+            url += `&since=${slotVersion}`;
+        }
+        
+        slotSocket = new WebSocket(url);
+        
+        slotSocket.onopen = () => {
+            reconnectDelay = 1000;
+        };
+        
+        slotSocket.onmessage = (event) => {
+            handleSlotMessage(JSON.parse(event.data));
+        };
+        
+        slotSocket.onclose = () => {
+            if (leavingPage) return;
+            
+            // Show something while the stream is unavailable
+            if (slotVersion === null && slots.length === 0 && !usedRestFallback) {
+                usedRestFallback = true;
+                fetchSlots();
+            }
+            
+            setTimeout(connectSlotStream, reconnectDelay);
+            reconnectDelay = Math.min(reconnectDelay * 2, 30000);
+        };
+    }
+    
+    function handleSlotMessage(message) {
+        if (message.type === 'slot_snapshot') {
+            slots = message.slots.map(slot => ({
+                id: slot.id,
+                slot_number: slot.slot_number,
+                zone: slot.zone || 'General',
+                floor: slot.floor || 'Ground Floor',
+                status: (slot.status || '').toUpperCase(),
+                vehicle_type: slot.vehicle_type,
+                label: ''
+            }));
+            slotVersion = message.version;
+            console.log(`Slot snapshot v${slotVersion}: ${slots.length} slots`);
+            renderSlots();
+            restoreSelection();
+        } else if (message.type === 'slot_resumed') {
+            console.log(`Slot stream resumed from v${message.version}`);
+        } else if (message.type === 'slot_resync') {
+            requestSnapshot('Slot stream out of order');
+        } else if (message.type === 'slot_delta') {
+            if (slotVersion === null) return;
+            
+            // A message was lost, or a change arrived after later ones: the grid may be stale
+            if (message.prev > slotVersion || message.changes.some(([, , version]) => version <= slotVersion)) {
+                requestSnapshot('Slot stream gap detected');
+                return;
+            }
+            
+            message.changes.forEach(([slotId, status]) => applySlotChange(slotId, status));
+            slotVersion = message.version;
+        }
+    }
+    
+    function requestSnapshot(reason) {
+        // Reconnect without a version to get a fresh snapshot
+        console.log(`${reason}, requesting a new snapshot`);
+        slotVersion = null;
+        slotSocket.close();
+    }
+    
+    function applySlotChange(slotId, status) {
+        const slot = slots.find(s => s.id === slotId);
+        if (!slot) return;
+        slot.status = status;
+        
+        const card = document.querySelector(`.slot-card[data-slot-id="${slotId}"]`);
+        if (!card) return;
+        
+        const isBooked = status === 'RESERVED' || status === 'OCCUPIED';
+        card.classList.toggle('booked', isBooked);
+        card.classList.toggle('available', !isBooked);
+        card.querySelector('.slot-status').textContent = isBooked ? 'Booked' : 'Available';
+        
+        if (isBooked && selectedSlot && selectedSlot.dataset.slotId === String(slotId)) {
+            clearSelection();
+            alert(`Slot ${slot.slot_number} was just booked by someone else. Please choose another slot.`);
+        }
+    }
+    
+    function restoreSelection() {
+        // Snapshots re-render the grid; keep the user's choice if it is still free
+        if (!selectedSlot) return;
+        const card = document.querySelector(`.slot-card.available[data-slot-id="${selectedSlot.dataset.slotId}"]`);
+        if (card) {
+            card.classList.add('selected');
+            selectedSlot = card;
+        } else {
+            clearSelection();
+        }
+    }
+    
+    function stopSlotStream() {
+        leavingPage = true;
+        if (slotSocket) slotSocket.close();
+    }
+    
+    window.addEventListener('beforeunload', stopSlotStream);
+    
     function renderSlots() {
         const container = document.getElementById('slots-container');
         
@@ -501,6 +629,9 @@ document.addEventListener('DOMContentLoaded', () => {
     }
     
     function showBookingConfirmation(booking, slotNumber) {
+        // Our own booking would otherwise arrive as a delta for the selected slot
+        stopSlotStream();
+        
         // Create confirmation modal/message
         // Use the actual price from backend response (includes dynamic pricing)
         const totalCost = booking.price || 0;